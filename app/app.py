@@ -11,7 +11,6 @@ from PIL import ImageOps, Image
 from datetime import datetime
 from datetime import timedelta
 from time import sleep
-import statistics
 from gui import TrackerGUI
 from mouse_lock import block_mouse_movement, unblock_mouse_movement
 from encounter_detect import get_encounter_type
@@ -27,7 +26,8 @@ from poe_bridge import (
     get_recent_xph,
     events,
     get_recent_encounters,
-    get_current_map
+    get_current_map,
+    get_recent_maps
 )
 from instance_tracker import MapInstance
 from settings import config
@@ -40,6 +40,7 @@ from screenshot import capture_window, find_poe_window
 import traceback
 from dataclasses import dataclass
 from typing import Optional
+from xp_validator import XPReadingValidator, max_plausible_xph, previous_snapshot
 from Levenshtein import distance as Levenshtein
 
 # Configure Tesseract path (adjust if necessary)
@@ -47,12 +48,16 @@ pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tessera
 
 tts_engine = None
 ocr_queue = queue.Queue()
+# a reading of the previous capture that was rejected only for breaking continuity, see XPReadingValidator
+_unconfirmed_xp_reading = None
 
 @dataclass
 class OCRXPJob:
     image: Image.Image
     was_in_map: bool
     then: datetime
+    map_id: Optional[str] = None
+    area_level: Optional[int] = None
 
     def run(self):
         if self.was_in_map:
@@ -68,7 +73,7 @@ class OCRXPJob:
         width, height = self.image.size
         crop_height = int(height * 0.15)
         cropped_image = self.image.crop((width * 0.2, height - crop_height, width * 0.9, height))
-        xp_value = ocr_xp(cropped_image)
+        xp_value = ocr_xp(cropped_image, self.then, self.area_level)
         if xp_value is not None: 
             snapshot = apply_xp_snapshot(xp_value, self.then, source="ocr", encounter_type=encounter_type)
         else:
@@ -90,7 +95,8 @@ class OCRXPJob:
                 self.then,
                 encounter_data,
                 image_path,
-                snapshot
+                snapshot,
+                snapshot.map_id if snapshot else self.map_id
             )
             add_encounter(encounter)
 
@@ -147,9 +153,9 @@ def _capture_item():
                 else:
                     screenshot = capture_window(find_poe_window())
                     ritual_encounter = None
-                    start_ts = get_current_map().span.start
+                    map_id = get_current_map().id
                     for encounter in reversed(get_recent_encounters()):
-                        if encounter.ts < start_ts:
+                        if encounter.map_id != map_id:
                             break
                         if encounter.type == "ritual":
                             ritual_encounter = encounter
@@ -185,7 +191,8 @@ def _capture_xp():
             unblock_mouse_movement(lock_handle)
             mouse_controller.position = original_position
         
-        ocr_queue.put(OCRXPJob(screenshot, in_map(), datetime.now()))
+        current_map = get_current_map()
+        ocr_queue.put(OCRXPJob(screenshot, in_map(), datetime.now(), current_map.id if current_map else None, current_map.area_level if current_map else None))
     except Exception as e:
         print(f"[Error] Exception during XP capture: {e}\n{traceback.format_exc()}")
 
@@ -211,36 +218,32 @@ def parse_xp(xp_text):
             return int(xp_value), int(next_level_xp)
     return None, None
 
-def ocr_xp(image, previous_xp = None):
-    if previous_xp is None:
-        previous_xp = get_recent_xp_snapshots()[-1].xp if get_recent_xp_snapshots() else None
+def ocr_xp(image, ts = None, area_level = None):
+    """
+    runs OCR passes until one reads an XP value satisfying the XPReadingValidator constraints, None if none does
+    """
+    global _unconfirmed_xp_reading
+    previous = previous_snapshot(get_recent_xp_snapshots(), ts)
+    validator = XPReadingValidator(previous, ts, max_plausible_xph(list(get_recent_maps()), area_level), _unconfirmed_xp_reading)
     ocr_methods = [
         ("grayscale", lambda img: img.convert("L")),
         ("binary", lambda img: ImageOps.invert(img.convert("L")).point(lambda p: p > 128 and 255)),
         ("color", lambda img: img),
         ("inverted", lambda img: ImageOps.invert(img.convert("L")))
     ]
-    xp_values = []
     for method_name, preprocess in ocr_methods:
         processed_image = preprocess(image)
         xp_text = pytesseract.image_to_string(processed_image, config="--psm 6 --oem 3")
         xp_value, next_level_xp = parse_xp(xp_text)
-
-        if xp_value is not None:
-            xp_values.append(xp_value)
-
-        # Stop early if a valid XP value is within 50% of prior XP
-        if previous_xp is not None and xp_value is not None:
-            if abs(xp_value - previous_xp) / previous_xp <= 0.5:
-                if len(xp_values) == 2 and xp_values[0] == xp_values[1]:
-                    return xp_value
-
-    xp_value = (
-        min(xp_values, key=lambda x: abs(x - previous_xp))
-        if previous_xp is not None and xp_values
-        else statistics.mode(xp_values) if xp_values else None
-    )
-    return xp_value
+        if xp_value is None:
+            continue
+        violation = validator.check(xp_value, next_level_xp)
+        if violation is None:
+            _unconfirmed_xp_reading = None
+            return xp_value
+        print(f"[Info] rejected OCR XP reading {xp_value} ({method_name}): {violation}")
+    _unconfirmed_xp_reading = validator.next_unconfirmed()
+    return None
 
 def parse_tribute_cost(text) -> Optional[int]:
     lines = text.splitlines()
@@ -275,6 +278,8 @@ def _on_map_completed(event):
     if not map or not map.xph or map.is_tower() or map.is_unlockable_hideout():
         return
     recent_xph = get_recent_xph()
+    if not recent_xph:
+        return
     (rating, percent_diff) = _rate_map_completion_xph(map.xph, recent_xph)
     tts_engine.say(f"map completed: {map.map_label}. {rating}")
     threading.Thread(target=tts_engine.runAndWait).start()
@@ -2,9 +2,50 @@ import duckdb
 
 conn = duckdb.connect(f"user_data/poe_tracker.duckdb")
 conn.execute("""CREATE TABLE IF NOT EXISTS maps (id string, data JSON)""")
-conn.execute("""CREATE TABLE IF NOT EXISTS instance_manager_state (id string, field string, data JSON)""")
 conn.execute("""CREATE TABLE IF NOT EXISTS xp_snapshots (id string, data JSON)""")
-conn.execute("""CREATE UNIQUE INDEX IF NOT EXISTS idx_instance_manager_state_field ON instance_manager_state (field)""")
-conn.execute("""CREATE TABLE IF NOT EXISTS gui_state (field string, data JSON)""")
-conn.execute("""CREATE UNIQUE INDEX IF NOT EXISTS idx_gui_state_field ON instance_manager_state (field)""")
 conn.execute("""CREATE TABLE IF NOT EXISTS encounters (id string, data JSON)""")
+_backfill_xp_segments = not conn.execute("SELECT count(*) FROM information_schema.tables WHERE table_name = 'xp_segments'").fetchone()[0]
+conn.execute("""CREATE TABLE IF NOT EXISTS xp_segments (id string, map_id string, data JSON)""")
+conn.execute("""ALTER TABLE xp_snapshots ADD COLUMN IF NOT EXISTS map_id string""")
+conn.execute("""ALTER TABLE encounters ADD COLUMN IF NOT EXISTS map_id string""")
+conn.execute("""CREATE INDEX IF NOT EXISTS idx_xp_snapshots_map_id ON xp_snapshots (map_id)""")
+conn.execute("""CREATE INDEX IF NOT EXISTS idx_encounters_map_id ON encounters (map_id)""")
+conn.execute("""CREATE INDEX IF NOT EXISTS idx_xp_segments_map_id ON xp_segments (map_id)""")
+conn.execute("""CREATE OR REPLACE VIEW map_spans AS 
+    SELECT id, CAST(data->'span'->>'start' AS TIMESTAMP) AS start_ts, CAST(data->'span'->>'end' AS TIMESTAMP) AS end_ts FROM maps""")
+# ladder_history only holds entries around tracked characters that changed since the previous fetch of their league, rank NULL
+# marks an entry that dropped off the ladder or out of the recorded window
+conn.execute("""CREATE TABLE IF NOT EXISTS ladder_fetches (fetch_ts TIMESTAMP NOT NULL, league string NOT NULL, version string, entries INTEGER)""")
+conn.execute("""CREATE TABLE IF NOT EXISTS ladder_history (fetch_ts TIMESTAMP NOT NULL, league string NOT NULL, rank INTEGER, character_id string NOT NULL, character_name string, level INTEGER, experience BIGINT, dead BOOLEAN)""")
+conn.execute("""CREATE TABLE IF NOT EXISTS ladder_latest (league string NOT NULL, rank INTEGER, character_id string NOT NULL, character_name string, level INTEGER, experience BIGINT, dead BOOLEAN)""")
+conn.execute("""CREATE INDEX IF NOT EXISTS idx_ladder_history_character ON ladder_history (league, character_id)""")
+conn.execute("""CREATE TABLE IF NOT EXISTS kv_state (key string PRIMARY KEY, version BIGINT NOT NULL, updated_at TIMESTAMP NOT NULL, data JSON)""")
+
+# migrate the legacy state tables, gui_state was append-only and is deduped to its latest row per field
+_legacy_tables = {row[0] for row in conn.execute("SELECT table_name FROM information_schema.tables WHERE table_name IN ('instance_manager_state', 'gui_state')").fetchall()}
+if "instance_manager_state" in _legacy_tables:
+    conn.execute("""INSERT INTO kv_state SELECT field, 1, now(), json_merge_patch(data, json_object('id', id)) FROM instance_manager_state ON CONFLICT DO NOTHING""")
+    conn.execute("""DROP TABLE instance_manager_state""")
+if "gui_state" in _legacy_tables:
+    conn.execute("""INSERT INTO kv_state SELECT field, 1, now(), arg_max(data, rowid) FROM gui_state GROUP BY field ON CONFLICT DO NOTHING""")
+    conn.execute("""DROP TABLE gui_state""")
+
+# segments are recorded at ingest, derive them once for snapshots that predate that
+if _backfill_xp_segments:
+    conn.execute("""
+        INSERT INTO xp_segments
+        SELECT id, map_id, json_object('start_ts', start_ts, 'end_ts', end_ts, 'xp', xp, 'encounter_type', encounter_type, 'source', source, 'map_id', map_id)
+        FROM (
+            SELECT
+                id,
+                map_id,
+                data->>'ts' AS start_ts,
+                lead(data->>'ts') OVER w AS end_ts,
+                lead(CAST(data->>'delta' AS BIGINT)) OVER w AS xp,
+                data->>'encounter_type' AS encounter_type,
+                data->>'source' AS source
+            FROM xp_snapshots
+            WINDOW w AS (ORDER BY CAST(data->>'ts' AS TIMESTAMP))
+        )
+        WHERE end_ts IS NOT NULL
+    """)
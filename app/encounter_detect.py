@@ -4,11 +4,13 @@ import numpy as np
 from PIL import Image
 import imagehash
 import simple_ocr
+from template_bank import TemplateBank, TextTemplateSpec
 from PIL.Image import Image as PILImage
 from typing import Optional, Dict, Any
 from functools import partial
+import os
 import time
-from PySide6.QtGui import QFont
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from dataclasses import dataclass
 from collections import defaultdict
 from Levenshtein import distance as Levenshtein
@@ -20,6 +22,18 @@ COLOR_WHITE = (255, 255, 255)
 COLOR_NORMAL = (75, 75, 75)
 COLOR_MAGIC = (46, 57, 96)
 COLOR_RARE = (96, 85, 32)
+COLOR_STRONGBOX = (193, 193, 193)
+COLOR_EXPLOSIVES = (255, 0, 0)
+
+# every template the detectors match, rendered once into the template bank
+TEXT_TEMPLATES = [
+    TextTemplateSpec("Ritual", 9.0, COLOR_WHITE),
+    TextTemplateSpec("Strongbox", 12.0, COLOR_STRONGBOX),
+    TextTemplateSpec("Essence of", 9.0, COLOR_RARE),
+    TextTemplateSpec("Detonator", 12.5, COLOR_NORMAL),
+    TextTemplateSpec("Detonate Explosives", 12.5, COLOR_EXPLOSIVES),
+]
+text_templates = TemplateBank(TEXT_TEMPLATES)
 
 @dataclass
 class EncounterCtx:
@@ -46,6 +60,13 @@ class EncounterCtx:
             self.image_hsv = cv2.cvtColor(self.image, cv2.COLOR_BGR2HSV)
         return self.image_hsv
 
+    def prepare(self):
+        """
+        computes the derived images up front, so detectors running concurrently only read the ctx
+        """
+        self.get_image_gs_small()
+        self.get_image_hsv()
+
     def set_current_debug_name(self, name: str):
         self.current_debug_name = name
 
@@ -91,7 +112,7 @@ _RITUAL_ALTAR_TYPES = ["Smothered", "Infested", "Tainted", "Contaminated", "Sapp
 def is_ritual(ctx: EncounterCtx) -> Optional[Dict]:
     scale = 0.5
     image = ctx.get_image_gs_small()
-    find_anchors = partial(_find_anchors, ctx = ctx, image=image, threshold=0.5, font_size=18 * scale, font_color=(255, 255, 255))
+    find_anchors = partial(_find_anchors, ctx = ctx, image=image, threshold=0.5, font_size=18 * scale, font_color=COLOR_WHITE)
     anchors, template = find_anchors("Ritual")
     if not anchors:
         return (None, None)
@@ -125,7 +146,7 @@ _STRONGBOX_TYPES = ["Arcane","Ornate", "Researcher's", "Armourer's", "Blacksmith
 def is_strongbox(ctx: EncounterCtx) -> Optional[Dict]:
     scale = 0.5
     image = ctx.get_image_gs_small()
-    find_anchors = partial(_find_anchors, ctx = ctx, image = image, threshold=0.5, font_size=24 * scale, font_color=(193, 193, 193))
+    find_anchors = partial(_find_anchors, ctx = ctx, image = image, threshold=0.5, font_size=24 * scale, font_color=COLOR_STRONGBOX)
     anchors, template = find_anchors("Strongbox")
     if not anchors:
         return (None, None)
@@ -180,7 +201,7 @@ def is_essence(ctx: EncounterCtx) -> Optional[Dict]:
 def is_expedition(ctx: EncounterCtx) -> Optional[Dict]:
     if _contains_text("Detonator", ctx):
         return ("Expedition", {"is_armed": False})
-    if _contains_text("Detonate Explosives", ctx, font_color=(255, 0, 0)):
+    if _contains_text("Detonate Explosives", ctx, font_color=COLOR_EXPLOSIVES):
         return ("Expedition", {"is_armed": True})
     return (None, None)
 
@@ -247,9 +268,7 @@ def image_to_opencv(image):
 def _find_anchors(text, ctx: EncounterCtx, image=None, threshold=0.5, scale=1.0, font_size=25, font_color=COLOR_NORMAL):
     if scale > 1.0:
         raise ValueError("scale must be lte 1.0")
-    font = simple_ocr.load_font_q(font_size * scale)
-    font.setWeight(QFont.Weight(100))
-    template = simple_ocr.text_template_q(text, font=font, color=font_color)
+    template = text_templates.get(text, font_size * scale, font_color)
     if scale < 1.0:
         tiny_image = simple_ocr.resize_image(image, scale)
         tiny_template = template
@@ -299,17 +318,83 @@ def _contains_text(text, ctx: EncounterCtx, image=None, threshold=0.5, scale=0.5
                     return True
     return False
 
+ENCOUNTER_DETECTORS = [is_breach, is_ritual, is_strongbox, is_expedition, is_essence]
+
+def _timed(detector, ctx: EncounterCtx):
+    start = time.time()
+    result = detector(ctx)
+    return (result, time.time() - start)
+
+class EncounterDetectionEngine:
+    """
+    Runs detectors concurrently on a bounded thread pool against a shared ctx, matchTemplate and tesseract release the GIL.
+    in first-match mode the result is the same as running the detectors in order, detectors after a match are cancelled
+    if they have not started yet. debug ctxs are run sequentially, they record per-detector debug info
+    """
+
+    def __init__(self, detectors=ENCOUNTER_DETECTORS, max_workers: int = None):
+        self.detectors = list(detectors)
+        self.max_workers = max_workers or min(len(self.detectors), os.cpu_count() or 1)
+        self._executor = None
+
+    def detect(self, ctx: EncounterCtx, all_matches: bool = False) -> list[tuple[str, Dict]]:
+        """
+        :return: (name, data) of the first matching detector, or of every matching one in detector order if all_matches
+        """
+        if ctx.debug or self.max_workers <= 1:
+            return self._detect_sequential(ctx, all_matches)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="encounter-detect")
+        ctx.prepare()
+        futures = [self._executor.submit(_timed, detector, ctx) for detector in self.detectors]
+        matches = []
+        pending = set(futures)
+        next_ix = 0
+        try:
+            while next_ix < len(futures):
+                # consume finished detectors in order, a match is final once every detector before it has finished
+                while next_ix < len(futures) and futures[next_ix].done():
+                    (name, data), took = futures[next_ix].result()
+                    if name:
+                        print(f"Encounter detected: {name} in {took} seconds data: {data}")
+                        matches.append((name, data))
+                        if not all_matches:
+                            return matches
+                    next_ix += 1
+                pending = {future for future in pending if not future.done()}
+                if pending:
+                    wait(pending, return_when=FIRST_COMPLETED)
+            return matches
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _detect_sequential(self, ctx: EncounterCtx, all_matches: bool) -> list[tuple[str, Dict]]:
+        matches = []
+        for detector in self.detectors:
+            (name, data), took = _timed(detector, ctx)
+            if name:
+                print(f"Encounter detected: {name} in {took} seconds data: {data}")
+                matches.append((name, data))
+                if not all_matches:
+                    break
+        return matches
+
+detection_engine = EncounterDetectionEngine()
+
 def get_encounter_type(image):
     opencv_image = image_to_opencv(image)
     ctx = EncounterCtx(image=opencv_image)
-    for algo in [is_breach, is_ritual, is_strongbox, is_expedition, is_essence]:
-        start = time.time()
-        (name, data) = algo(ctx)
-        end = time.time()
-        if name:
-            print(f"Encounter detected: {name} in {end - start} seconds data: {data}")
-            return (name, data)
-    return (None, None)
+    matches = detection_engine.detect(ctx)
+    return matches[0] if matches else (None, None)
+
+def get_encounter_types(image) -> list[tuple[str, Dict]]:
+    """
+    :return: every detected encounter, in detector order
+    """
+    opencv_image = image_to_opencv(image)
+    ctx = EncounterCtx(image=opencv_image)
+    return detection_engine.detect(ctx, all_matches=True)
 
 def debug_encounters(image):
     opencv_image = image_to_opencv(image)
@@ -21,6 +21,8 @@ from gui_components.stats import StatsWindow
 from gui_components.debug import DebugWidget
 from gui_components.config import ConfigFrame
 from gui_components.encounters import EncountersWidget
+from encounter_detect import text_templates
+from leveling_sim import start_leveling_eta
 from gui_components.debug import DebugWidget
 import traceback
 from PySide6.QtCore import qInstallMessageHandler, QtMsgType
@@ -40,6 +42,8 @@ class TrackerGUI:
 
     def _create_gui(self):
         app = QApplication(sys.argv)
+        text_templates.load()
+        start_leveling_eta()
         window = QMainWindow()
         window.setWindowTitle("PoE Tracker")
         window.setGeometry(100, 100, 1000, 600)
@@ -1,10 +1,107 @@
 import time
+import json
 import threading
 import tkinter as tk
-import pandas as pd
+import pyarrow as pa
 from poe_bridge import parse_all_maps_from_log
 import poe_bridge
 from db import conn
+from instance_tracker import MapInstance
+
+BATCH_SIZE = 5000
+
+MAP_BATCH_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("span_start", pa.timestamp("us")),
+    ("span_area_entered_at", pa.timestamp("us")),
+    ("span_end", pa.timestamp("us")),
+    ("span_map_time", pa.float64()),
+    ("span_hideout_time", pa.float64()),
+    ("span_load_time", pa.float64()),
+    ("span_pause_time", pa.float64()),
+    ("map_name", pa.string()),
+    ("map_label", pa.string()),
+    ("area_level", pa.int64()),
+    ("seed", pa.int64()),
+    ("xp_start", pa.int64()),
+    ("xp_gained", pa.int64()),
+    ("xph", pa.float64()),
+    ("waystone", pa.string()),
+    ("hideout_start_time", pa.timestamp("us")),
+    ("hideout_exit_time", pa.timestamp("us")),
+    ("has_boss", pa.bool_()),
+])
+
+def _iso(column):
+    # mirrors datetime.isoformat(), which omits the fraction if there are no microseconds
+    return f"""CASE WHEN microsecond({column}) % 1000000 = 0
+        THEN strftime({column}, '%Y-%m-%dT%H:%M:%S')
+        ELSE strftime({column}, '%Y-%m-%dT%H:%M:%S.%f') END"""
+
+# builds the same document as MapInstance.to_dict, but column-wise inside duckdb
+_INSERT_BATCH_QUERY = f"""
+    INSERT INTO maps
+    SELECT id, json_object(
+        'span', json_object(
+            'start', {_iso("span_start")},
+            'area_entered_at', {_iso("span_area_entered_at")},
+            'end', {_iso("span_end")},
+            'map_time', span_map_time,
+            'hideout_time', span_hideout_time,
+            'load_time', span_load_time,
+            'pause_time', span_pause_time
+        ),
+        'map_name', map_name,
+        'map_label', map_label,
+        'area_level', area_level,
+        'seed', seed,
+        'xp_start', xp_start,
+        'xp_gained', xp_gained,
+        'xph', xph,
+        'waystone', CAST(waystone AS JSON),
+        'hideout_start_time', {_iso("hideout_start_time")},
+        'hideout_exit_time', {_iso("hideout_exit_time")},
+        'has_boss', has_boss
+    )
+    FROM _arrow_map_batch
+"""
+
+def mk_map_batch(maps: list[MapInstance]) -> pa.RecordBatch:
+    """
+    Builds an arrow record batch straight from MapInstance fields, skipping the to_dict/json round trip
+    """
+    def seconds(maps, get):
+        return [get(m).total_seconds() if get(m) is not None else None for m in maps]
+
+    map_times = [m.span.map_time() for m in maps]
+    return pa.RecordBatch.from_arrays([
+        pa.array([m.id for m in maps], pa.string()),
+        pa.array([m.span.start for m in maps], pa.timestamp("us")),
+        pa.array([m.span.area_entered_at for m in maps], pa.timestamp("us")),
+        pa.array([m.span.end for m in maps], pa.timestamp("us")),
+        pa.array([t.total_seconds() if t is not None else None for t in map_times], pa.float64()),
+        pa.array(seconds(maps, lambda m: m.span.hideout_time), pa.float64()),
+        pa.array(seconds(maps, lambda m: m.span.load_time), pa.float64()),
+        pa.array(seconds(maps, lambda m: m.span.pause_time), pa.float64()),
+        pa.array([m.map_name for m in maps], pa.string()),
+        pa.array([m.map_label for m in maps], pa.string()),
+        pa.array([m.area_level for m in maps], pa.int64()),
+        pa.array([m.seed for m in maps], pa.int64()),
+        pa.array([m.xp_start for m in maps], pa.int64()),
+        pa.array([m.xp_gained for m in maps], pa.int64()),
+        pa.array([m.xph for m in maps], pa.float64()),
+        pa.array([json.dumps(m.waystone.to_dict()) if m.waystone else None for m in maps], pa.string()),
+        pa.array([m.hideout_start_time for m in maps], pa.timestamp("us")),
+        pa.array([m.hideout_exit_time for m in maps], pa.timestamp("us")),
+        pa.array([m.has_boss for m in maps], pa.bool_()),
+    ], schema=MAP_BATCH_SCHEMA)
+
+def insert_map_batch(maps: list[MapInstance]):
+    conn.register("_arrow_map_batch", mk_map_batch(maps))
+    try:
+        conn.execute(_INSERT_BATCH_QUERY)
+    finally:
+        conn.unregister("_arrow_map_batch")
 
 class InstanceLoader:
     def __init__(self):
@@ -12,30 +109,38 @@ class InstanceLoader:
         self.running = True
         self.stop = False
         self.modal = None
+        self.insert_time = 0.0
 
     def load_instance_data_from_log(self):
         if self.stop:
             raise Exception("loader stopped, cannot resume")
 
+        start = time.perf_counter()
         try:
             buf = []
             for instance in parse_all_maps_from_log():
                 if self.stop:
                     return
                 self.n += 1
-                buf.append([instance.id, instance.to_dict()])
-                if len(buf) >= 1000:
-                    df = pd.DataFrame(buf, columns=["id", "data"])
-                    conn.register("_pd_buf_table", df)
-                    conn.execute("INSERT INTO maps SELECT * FROM _pd_buf_table")
-                    buf.clear()
+                buf.append(instance)
+                if len(buf) >= BATCH_SIZE:
+                    self._flush(buf)
             if buf:
-                conn.executemany("INSERT INTO maps VALUES (?, ?)", buf)
+                self._flush(buf)
+            took = time.perf_counter() - start
+            print(f"[Info] imported {self.n} maps in {took:.2f}s ({self.n / took:.0f} maps/s), inserting took {self.insert_time:.2f}s ({self.n / self.insert_time if self.insert_time else 0:.0f} maps/s)")
             # FIXME handle current_map properly (?)
             poe_bridge._load_state()
+            poe_bridge.events.emit("maps_imported", {"count": self.n})
         finally:
             self.running = False
 
+    def _flush(self, buf):
+        start = time.perf_counter()
+        insert_map_batch(buf)
+        self.insert_time += time.perf_counter() - start
+        buf.clear()
+
     def cancel(self):
         self.stop = True
         if self.modal:
@@ -5,20 +5,28 @@ from PySide6.QtCore import QTimer, Qt
 from PySide6.QtGui import QFont
 from datetime import datetime, timedelta
 import traceback
-import statistics
-from poe_bridge import get_current_map, get_recent_xp_snapshots, get_recent_maps, events, get_recent_xph, get_next_waystone
-from ladder_api import LadderEntry
-from db import conn
+from poe_bridge import get_current_map, get_recent_xp_snapshots, get_recent_xp_segments, events, get_recent_xph, get_idle_stats, get_next_waystone, get_current_ladder_entry
+from leveling_sim import leveling_sim
+from rank_race import rank_race
 from xp_table import get_level_from_xp, get_xp_range_for_level
 from area_tla import get_threat_indicator
 from util.format import format_number
 
+RANK_PROJECTION_HOURS = 6
 
 def mk_label(text, font = QFont("Helvetica", 12, QFont.Normal)):
     label = QLabel(text)
     label.setFont(font)
     return label
 
+def format_eta(level_eta):
+    hours = level_eta.hours
+    if hours.get(50) is None:
+        return None
+    if hours.get(10) is None or hours.get(90) is None:
+        return f"{hours[50]:.1f}h"
+    return f"{hours[50]:.1f}h ({hours[10]:.1f}-{hours[90]:.1f}h)"
+
 class OverviewWidget(QWidget):
 
     def __init__(self):
@@ -64,10 +72,9 @@ class OverviewWidget(QWidget):
         self.layout.addStretch()
         self.setLayout(self.layout)
 
-        self.current_ladder_entry = None
-        for field, data in conn.execute("SELECT field, data FROM gui_state").fetchall():
-            if field == "current_ladder_entry":
-                self.current_ladder_entry = LadderEntry.from_row(data)
+        self.current_ladder_entry = get_current_ladder_entry()
+        # character id -> entry of the ladder watchlist
+        self.watched_ladder_entries = {}
 
         events.on("ladder_data", self.update_ladder_entry)
         self.update()
@@ -117,38 +124,31 @@ class OverviewWidget(QWidget):
                         self.mods_layout.addWidget(mod_label)
 
             encounters = []
-            if get_recent_xp_snapshots() and current_map:
-                map_start_time = current_map.span.start
-                xp_snapshots = list(get_recent_xp_snapshots())
-                for i in range(len(xp_snapshots), 0, -1):
-                    snapshot = xp_snapshots[i - 1]
-                    if i == len(xp_snapshots):
-                        # incomplete head snapshot, has no next
-                        next_snapshot = None
-                    else:
-                        next_snapshot = get_recent_xp_snapshots()[i]
-                    if snapshot.ts < map_start_time:
-                        break
-                    if snapshot.encounter_type == "hideout" or snapshot.source == "ladder":
-                        continue
-
-                    if next_snapshot:
-                        duration = (next_snapshot.ts - snapshot.ts).total_seconds()
-                        xp_gained = next_snapshot.delta
-                    else:
-                        duration = (now_or_ho - snapshot.ts).total_seconds()
-                        xp_gained = 0
-
-                    if duration < 0:
-                        continue
-
+            if current_map:
+                def add_encounter_row(encounter_type, xp_gained, duration):
                     xph = (xp_gained / duration) * 3600 if duration > 0 else 0
                     encounters.append({
-                        "Encounter Type": snapshot.encounter_type,
+                        "Encounter Type": encounter_type,
                         "XP": xp_gained,
                         "XP/H": int(xph),
                         "Duration": str(timedelta(seconds=int(duration))),
                     })
+
+                def is_encounter(snapshot_or_segment):
+                    return snapshot_or_segment.encounter_type != "hideout" and snapshot_or_segment.source != "ladder"
+
+                # only the open head segment, which has no closing snapshot yet, is computed live
+                head = get_recent_xp_snapshots()[-1] if get_recent_xp_snapshots() else None
+                if head and head.map_id == current_map.id and is_encounter(head):
+                    duration = (now_or_ho - head.ts).total_seconds()
+                    if duration >= 0:
+                        add_encounter_row(head.encounter_type, 0, duration)
+                for segment in reversed(get_recent_xp_segments()):
+                    if segment.map_id != current_map.id:
+                        break
+                    duration = segment.duration().total_seconds()
+                    if is_encounter(segment) and duration >= 0:
+                        add_encounter_row(segment.encounter_type, segment.xp, duration)
                 encounters.reverse()
 
             if encounters:
@@ -173,13 +173,15 @@ class OverviewWidget(QWidget):
             else:
                 self.encounters_group.hide()
 
-            if self.current_ladder_entry:
+            if self.current_ladder_entry or self.watched_ladder_entries:
                 self.clear_layout(self.ladder_layout)
+            if self.current_ladder_entry:
                 ladder_entry = self.current_ladder_entry
                 character_name = ladder_entry.character.name
                 rank = ladder_entry.rank
                 xpp = "?"
                 eta = "?"
+                target_eta = None
                 idle_p = "?"
                 if get_recent_xp_snapshots():
                     xp = get_recent_xp_snapshots()[-1].xp
@@ -187,23 +189,15 @@ class OverviewWidget(QWidget):
                     (xp_lo, xp_hi) = get_xp_range_for_level(level)
                     xp_delta = xp - xp_lo
                     xpp = xp_delta / (xp_hi - xp_lo) * 100
-                    valid_maps = list(filter(lambda m: m.xph, get_recent_maps()))
                     recent_xph = get_recent_xph()
-                    idle_p_list = []
-                    idle_load = []
-                    idle_pause = []
-                    idle_hideout = []
-                    for m in valid_maps:
-                        idle_p_list.append(m.span.idle_time() / (m.span.map_time() + m.span.idle_time()))
-                        idle_load.append(m.span.load_time)
-                        idle_pause.append(m.span.pause_time)
-                        idle_hideout.append(m.span.hideout_time)
-                    idle_p = statistics.median(idle_p_list)
-                    idle_load = statistics.median(idle_load)
-                    idle_pause = statistics.median(idle_pause)
-                    idle_hideout = statistics.median(idle_hideout)
-                    if recent_xph > 0:
+                    idle_fraction = get_idle_stats()["idle_fraction"]
+                    idle_p = idle_fraction.median if idle_fraction else "?"
+                    if recent_xph > 0 and idle_fraction:
                         eta = f"{(xp_hi - xp) / recent_xph / (1 - idle_p):.1f}h"
+                    simulated = leveling_sim.latest()
+                    if level + 1 in simulated:
+                        eta = format_eta(simulated[level + 1]) or eta
+                    target_eta = next((simulated[l] for l in sorted(simulated) if l > level + 1), None)
 
                 self.ladder_layout.addRow("Character", mk_label(f"{character_name}"))
                 self.ladder_layout.addRow("Rank", mk_label(f"{rank}"))
@@ -213,14 +207,32 @@ class OverviewWidget(QWidget):
                 if ladder_entry.next:
                     xp_delta = ladder_entry.character.experience - ladder_entry.next.character.experience
                     self.ladder_layout.addRow("Behind", mk_label(f"{ladder_entry.next.character.name} (-{format_number(xp_delta)})"))
+                race = rank_race.latest()
+                if race and race.rank == rank:
+                    crossing = race.next_crossing()
+                    if crossing:
+                        label = "Overtake" if crossing.rank < rank else "Overtaken by"
+                        self.ladder_layout.addRow(label, mk_label(f"{crossing.character_name} in {crossing.crossing_hours:.1f}h"))
+                    self.ladder_layout.addRow(f"Rank in {RANK_PROJECTION_HOURS}h", mk_label(f"{race.rank_at(RANK_PROJECTION_HOURS)}"))
                 self.ladder_layout.addRow("XP", mk_label(f"{xpp:.3f}%"))
                 self.ladder_layout.addRow("Recent XP/H", mk_label(f"{format_number(recent_xph)}"))
-                self.ladder_layout.addRow("Idle", mk_label(f"{int(idle_p * 100)}%"))
+                self.ladder_layout.addRow("Idle", mk_label(f"{int(idle_p * 100)}%" if idle_p != "?" else idle_p))
                 self.ladder_layout.addRow("ETA", mk_label(f"{eta}"))
+                if target_eta:
+                    self.ladder_layout.addRow(f"ETA {target_eta.level}", mk_label(format_eta(target_eta) or "?"))
+            for watched_entry in sorted(self.watched_ladder_entries.values(), key=lambda entry: entry.rank):
+                text = f"#{watched_entry.rank} (level {watched_entry.character.level})"
+                if self.current_ladder_entry:
+                    xp_delta = watched_entry.character.experience - self.current_ladder_entry.character.experience
+                    text += f" {'+' if xp_delta >= 0 else '-'}{format_number(abs(xp_delta))}"
+                self.ladder_layout.addRow(watched_entry.character.name, mk_label(text))
 
         except Exception as e:
             print(f"[Error in update_overview]: {str(e)}\n{traceback.format_exc()}")
 
     def update_ladder_entry(self, event):
-        self.current_ladder_entry = event.get("ladder_data")
-        conn.execute("INSERT INTO gui_state (field, data) VALUES (?, ?)", ["current_ladder_entry", self.current_ladder_entry.to_dict()])
\ No newline at end of file
+        ladder_entry = event.get("ladder_data")
+        if not event.get("is_self", True):
+            self.watched_ladder_entries[ladder_entry.character.id] = ladder_entry
+            return
+        self.current_ladder_entry = ladder_entry
\ No newline at end of file
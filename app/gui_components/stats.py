@@ -4,6 +4,7 @@ from PySide6.QtCore import Qt
 import pandas as pd
 from db import conn
 from poe_bridge import events
+from layout_stats import layout_xph
 from util.format import format_number
 
 class QTableWidgetItem_C(QTableWidgetItem):
@@ -59,7 +60,14 @@ class StatsWindow(QWidget):
             GROUP BY data->>'map_name' 
             ORDER BY data->>'map_name'
         """
-        self.stats_df = stats_df = pd.read_sql(query, conn)
+        stats_df = pd.read_sql(query, conn)
+        intervals = layout_xph.results()
+        ci_at = stats_df.columns.get_loc("Median XP/H") + 1
+        for offset, (column, field) in enumerate([("Weighted XP/H", "xph"), ("XP/H CI Low", "ci_low"), ("XP/H CI High", "ci_high")]):
+            stats_df.insert(ci_at + offset, column, [
+                int(getattr(intervals[map_name], field)) if map_name in intervals else 0 for map_name in stats_df["Map Name"]
+            ])
+        self.stats_df = stats_df
         self.populate_table(stats_df)
 
     def populate_table(self, dataframe):
@@ -0,0 +1,119 @@
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+from sortedcontainers import SortedList
+from instance_tracker import MapInstance
+
+METRICS = ("idle_fraction", "load_time", "pause_time", "hideout_time")
+
+@dataclass
+class QuantileSummary:
+    median: float
+    p90: float
+
+class RollingQuantiles:
+    """
+    Multiset of values kept in sorted order, quantiles are looked up by rank in O(log n)
+    """
+
+    def __init__(self):
+        self._values = SortedList()
+
+    def __len__(self):
+        return len(self._values)
+
+    def add(self, value: float):
+        self._values.add(value)
+
+    def remove(self, value: float):
+        self._values.remove(value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        linearly interpolated quantile, equivalent to statistics.median for q=0.5
+        """
+        n = len(self._values)
+        if n == 0:
+            return None
+        pos = q * (n - 1)
+        lo = int(pos)
+        hi = min(lo + 1, n - 1)
+        return self._values[lo] + (self._values[hi] - self._values[lo]) * (pos - lo)
+
+def idle_metrics(map_time: float, load_time: float, pause_time: float, hideout_time: float) -> tuple[float, ...]:
+    idle_time = load_time + pause_time + hideout_time
+    total_time = map_time + idle_time
+    idle_fraction = idle_time / total_time if total_time > 0 else 0.0
+    return (idle_fraction, load_time, pause_time, hideout_time)
+
+class IdleStats:
+    """
+    Rolling medians and p90s of the idle metrics (see METRICS, times in seconds) over the last max_maps maps with xph.
+    summaries are recomputed once per update, reads return the cached values
+    """
+
+    def __init__(self, max_maps: int = 1000):
+        self.max_maps = max_maps
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self._quantiles = {metric: RollingQuantiles() for metric in METRICS}
+        self._entries = {}
+        self._order = deque()
+        self._summary = {metric: None for metric in METRICS}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def summary(self) -> dict[str, Optional[QuantileSummary]]:
+        return self._summary
+
+    def reset(self, rows):
+        """
+        :param rows: (map id, map_time, load_time, pause_time, hideout_time) tuples ordered oldest to newest
+        """
+        with self._lock:
+            self.clear()
+            for map_id, *times in rows:
+                self._add(map_id, idle_metrics(*times))
+            self._update_summary()
+
+    def add(self, map: MapInstance):
+        if not map.xph or not map.span.end:
+            return
+        span = map.span
+        values = idle_metrics(*(t.total_seconds() for t in [span.map_time(), span.load_time, span.pause_time, span.hideout_time]))
+        with self._lock:
+            self._add(map.id, values)
+            self._update_summary()
+
+    def remove(self, map_id: str):
+        with self._lock:
+            if self._remove(map_id):
+                self._update_summary()
+
+    def _add(self, map_id, values):
+        if map_id in self._entries:
+            return
+        self._entries[map_id] = values
+        self._order.append(map_id)
+        for metric, value in zip(METRICS, values):
+            self._quantiles[metric].add(value)
+        while len(self._entries) > self.max_maps:
+            self._remove(self._order.popleft())
+
+    def _remove(self, map_id) -> bool:
+        values = self._entries.pop(map_id, None)
+        if values is None:
+            return False
+        for metric, value in zip(METRICS, values):
+            self._quantiles[metric].remove(value)
+        return True
+
+    def _update_summary(self):
+        summary = {}
+        for metric, quantiles in self._quantiles.items():
+            summary[metric] = QuantileSummary(quantiles.quantile(0.5), quantiles.quantile(0.9)) if len(quantiles) else None
+        self._summary = summary
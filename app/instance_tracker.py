@@ -17,6 +17,7 @@ class XPSnapshot:
     area_level: Optional[int] = None
     source: Optional[str] = None
     encounter_type: Optional[str] = None
+    map_id: Optional[str] = None
 
     def __post_init__(self):
         if not isinstance(self.xp, int) or self.xp < 0:
@@ -34,7 +35,8 @@ class XPSnapshot:
             "delta": self.delta,
             "area_level": self.area_level,
             "source": self.source,
-            "encounter_type": self.encounter_type
+            "encounter_type": self.encounter_type,
+            "map_id": self.map_id
         }
     
     @classmethod
@@ -46,7 +48,54 @@ class XPSnapshot:
             delta=data["delta"],
             area_level=data["area_level"] if data["area_level"] else None,
             source=data["source"],
-            encounter_type=data["encounter_type"]
+            encounter_type=data["encounter_type"],
+            map_id=data.get("map_id")
+        )
+
+    @classmethod
+    def from_row(cls, id, data):
+        return cls.from_dict(id, json.loads(data))
+
+@dataclass
+class XPSegment:
+    """
+    XP gained between two consecutive snapshots, attributed to the snapshot that opened the segment
+    """
+    id: str # id of the opening snapshot
+    start_ts: datetime
+    end_ts: datetime
+    xp: int
+    encounter_type: Optional[str] = None
+    source: Optional[str] = None
+    map_id: Optional[str] = None
+
+    def duration(self) -> timedelta:
+        return self.end_ts - self.start_ts
+
+    def xph(self) -> float:
+        seconds = self.duration().total_seconds()
+        return self.xp / seconds * 3600 if seconds > 0 else 0
+
+    def to_dict(self):
+        return {
+            "start_ts": self.start_ts.isoformat(),
+            "end_ts": self.end_ts.isoformat(),
+            "xp": self.xp,
+            "encounter_type": self.encounter_type,
+            "source": self.source,
+            "map_id": self.map_id
+        }
+
+    @classmethod
+    def from_dict(cls, id, data):
+        return cls(
+            id,
+            start_ts=datetime.fromisoformat(data["start_ts"]),
+            end_ts=datetime.fromisoformat(data["end_ts"]),
+            xp=data["xp"],
+            encounter_type=data["encounter_type"],
+            source=data["source"],
+            map_id=data["map_id"]
         )
 
     @classmethod
@@ -275,6 +324,7 @@ class InstanceTracker:
         self.events = EventEmitter()
         self.recent_maps = deque(maxlen=100)
         self.recent_xp_snapshots = deque(maxlen=100)
+        self.recent_xp_segments = deque(maxlen=100)
         self._current_map = None
         self._next_waystone = None
         self._paused_at = None
@@ -464,9 +514,14 @@ class InstanceTracker:
         
         current_map = self._current_map
         area_level = current_map.area_level if current_map else None
-        snapshot = XPSnapshot(str(uuid.uuid4()), ts, xp, delta, area_level, source, encounter_type)
+        map_id = current_map.id if current_map else None
+        snapshot = XPSnapshot(str(uuid.uuid4()), ts, xp, delta, area_level, source, encounter_type, map_id)
         self.recent_xp_snapshots.append(snapshot)
         self.events.emit("xp_snapshot", {"snapshot": snapshot})
+        if prev:
+            segment = XPSegment(prev.id, prev.ts, ts, delta, prev.encounter_type, prev.source, prev.map_id)
+            self.recent_xp_segments.append(segment)
+            self.events.emit("xp_segment", {"segment": segment})
 
         if current_map:
             if current_map.xp_start:
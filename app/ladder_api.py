@@ -1,9 +1,23 @@
 import requests
+from requests.adapters import HTTPAdapter
+import ijson
 from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 from typing import Optional, List
 import json
+import os
+import re
+import threading
 # Base API URL
 BASE_API_URL = "https://pathofexile2.com/internal-api/content/game-ladder/id/"
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36"
+LADDER_CACHE_PATH = os.path.join("user_data", "ladder_cache")
+# (connect, read) timeouts in seconds
+LADDER_TIMEOUT = (5, 30)
+LADDER_CACHE_TTL = timedelta(seconds=60)
+LADDER_CHUNK_SIZE = 64 * 1024
+LADDER_ENTRIES_PREFIX = "context.ladder.entries.item"
 
 @dataclass
 class TwitchStream:
@@ -150,6 +164,219 @@ class LadderEntry:
     def from_row(cls, data):
         return cls.from_dict(json.loads(data))
 
+@dataclass(frozen=True)
+class LadderQuery:
+    account_name: Optional[str] = None
+    character_name: Optional[str] = None
+
+    def __post_init__(self):
+        if not self.account_name and not self.character_name:
+            raise ValueError("must specify account_name or character_name")
+
+    def matches(self, entry) -> bool:
+        if self.account_name and entry.get("account", {}).get("name") != self.account_name:
+            return False
+        if self.character_name and entry.get("character", {}).get("name") != self.character_name:
+            return False
+        return True
+
+    @classmethod
+    def parse(cls, name: str) -> 'LadderQuery':
+        """
+        account names carry a #discriminator, anything else is a character name
+        """
+        name = name.strip()
+        return cls(account_name=name) if "#" in name else cls(character_name=name)
+
+class LadderFetchError(Exception):
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        # seconds the server asked to wait before retrying (Retry-After)
+        self.retry_after = retry_after
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+@dataclass
+class LadderResponse:
+    league: str
+    # changes whenever the ladder body changes, the etag if the server sends one
+    version: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: datetime
+    path: str
+    # True if the body was downloaded by this fetch (and passed through its sink), not persisted
+    fresh: bool = False
+
+    def to_dict(self):
+        return {
+            "league": self.league,
+            "version": self.version,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "fetched_at": self.fetched_at.isoformat(),
+            "path": self.path
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            league=data["league"],
+            version=data["version"],
+            etag=data["etag"],
+            last_modified=data["last_modified"],
+            fetched_at=datetime.fromisoformat(data["fetched_at"]),
+            path=data["path"]
+        )
+
+class LadderClient:
+    """
+    Ladder HTTP client with a pooled session. responses are cached on disk, within cache_ttl the cached body is used
+    as-is, after that it is revalidated with a conditional request (ETag / Last-Modified). lookups are memoized per
+    response version, so a cache hit or a 304 skips reading and decoding the body
+    """
+
+    def __init__(self, base_url: str = BASE_API_URL, cache_path: str = LADDER_CACHE_PATH, cache_ttl: timedelta = LADDER_CACHE_TTL,
+                 timeout: tuple[float, float] = LADDER_TIMEOUT, pool_size: int = 4):
+        self.base_url = base_url
+        self.cache_path = cache_path
+        self.cache_ttl = cache_ttl
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._lock = threading.Lock()
+        # (league, version, queries) -> results of find_entries
+        self._memo = {}
+
+    def close(self):
+        self.session.close()
+
+    def clear_memo(self):
+        self._memo = {}
+
+    def fetch(self, league: str, sink=None) -> LadderResponse:
+        """
+        :param sink: called with each chunk of a downloaded body until it returns True
+        :return: the cached response, revalidated or refetched if older than cache_ttl
+        :raises LadderFetchError: if the ladder could not be fetched or revalidated
+        """
+        if not league:
+            raise ValueError("League is required")
+        with self._lock:
+            cached = self._load_meta(league)
+            if cached and datetime.now() - cached.fetched_at < self.cache_ttl:
+                return cached
+            headers = {}
+            if cached and cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached and cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+            try:
+                with self.session.get(f"{self.base_url}{league}", headers=headers, timeout=self.timeout, stream=True) as response:
+                    if response.status_code == 304 and cached:
+                        cached.fetched_at = datetime.now()
+                        self._save_meta(cached)
+                        return cached
+                    response.raise_for_status()
+                    return self._store(league, response, sink)
+            except requests.exceptions.HTTPError as e:
+                raise LadderFetchError(f"failed to fetch {league} ladder: {e}", parse_retry_after(e.response.headers.get("Retry-After"))) from e
+            except (requests.exceptions.RequestException, OSError) as e:
+                raise LadderFetchError(f"failed to fetch {league} ladder: {e}") from e
+
+    def fetch_json(self, league: str):
+        response = self.fetch(league)
+        with open(response.path, "rb") as f:
+            return json.load(f)
+
+    def find_entry(self, league: str, account_name: str = None, character_name: str = None) -> Optional[LadderEntry]:
+        """
+        :return: the entry of the account or character with its neighbours as prev / next, None if not ranked
+        :raises LadderFetchError: see fetch
+        """
+        query = LadderQuery(account_name, character_name)
+        return self.find_entries(league, [query])[query]
+
+    def find_entries(self, league: str, queries: List[LadderQuery]) -> dict[LadderQuery, Optional[LadderEntry]]:
+        """
+        looks up all queries in a single fetch and pass over the ladder
+
+        :return: query -> entry with its neighbours as prev / next, None if not ranked
+        :raises LadderFetchError: see fetch
+        """
+        finder = LadderEntryFinder(queries)
+        response = self.fetch(league, sink=finder.feed)
+        key = (league, response.version, tuple(queries))
+        if key not in self._memo:
+            if not response.fresh:
+                with open(response.path, "rb") as f:
+                    finder.search(f)
+            self._memo = {key: finder.results()}
+        return self._memo[key]
+
+    def _file_path(self, league: str, suffix: str) -> str:
+        return os.path.join(self.cache_path, re.sub(r"[^\w.-]", "_", league) + suffix)
+
+    def _load_meta(self, league: str) -> Optional[LadderResponse]:
+        try:
+            with open(self._file_path(league, ".meta.json"), "r") as f:
+                response = LadderResponse.from_dict(json.load(f))
+            return response if os.path.exists(response.path) else None
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _save_meta(self, response: LadderResponse):
+        path = self._file_path(response.league, ".meta.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(response.to_dict(), f)
+        os.replace(path + ".tmp", path)
+
+    def _store(self, league: str, response: requests.Response, sink=None) -> LadderResponse:
+        os.makedirs(self.cache_path, exist_ok=True)
+        path = self._file_path(league, ".json")
+        with open(path + ".tmp", "wb") as f:
+            for chunk in response.iter_content(chunk_size=LADDER_CHUNK_SIZE):
+                f.write(chunk)
+                if sink and sink(chunk):
+                    sink = None
+        os.replace(path + ".tmp", path)
+        now = datetime.now()
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        result = LadderResponse(league, etag or last_modified or now.isoformat(), etag, last_modified, now, path)
+        self._save_meta(result)
+        result.fresh = True
+        return result
+
+_client = None
+
+def get_client(base_url: str = None) -> LadderClient:
+    """
+    shared client, recreated if base_url changes
+    """
+    global _client
+    if not base_url:
+        base_url = _client.base_url if _client else BASE_API_URL
+    if _client is None or _client.base_url != base_url:
+        if _client:
+            _client.close()
+        _client = LadderClient(base_url)
+    return _client
+
 def fetch_ladder_data(league:str="Standard"):
     """
     Fetches ladder data for a specific league.
@@ -159,42 +386,117 @@ def fetch_ladder_data(league:str="Standard"):
     """
     if not league:
         raise ValueError("League is required")
-
-    api_url = f"{BASE_API_URL}{league}"
     try:
-        headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36"}
-        response = requests.get(api_url, headers=headers)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        return get_client().fetch_json(league)
+    except (LadderFetchError, ValueError) as e:
         print(f"Error fetching data from API: {e}")
         return None
 
 def fetch_data(account_name:str=None, character_name:str=None, league: str=None) -> Optional[LadderEntry]:
     if not account_name and not character_name:
         raise ValueError("must specify account_name or character_name")
-
-    ladder_data = fetch_ladder_data(league)
-    if not ladder_data:
+    try:
+        return get_client().find_entry(league, account_name, character_name)
+    except (LadderFetchError, ValueError) as e:
+        print(f"Error fetching data from API: {e}")
         return None
 
-    entries = ladder_data.get("context", {}).get("ladder", {}).get("entries", [])
-    
-    for i, entry in enumerate(entries):
-        if account_name and entry.get("account", {}).get("name") != account_name:
-            continue
-        elif character_name and entry.get("character", {}).get("name") != character_name:
-            continue
-        
-        current_entry = mk_ladder_entry(entry)
-        if i > 0:
-            current_entry.prev = mk_ladder_entry(entries[i - 1])
-        if i < len(entries) - 1:
-            current_entry.next = mk_ladder_entry(entries[i + 1])
-            
-        return current_entry
-
-    return None
+def iter_ladder_entries(path: str):
+    """
+    yields the raw entries of a cached ladder response body
+    """
+    with open(path, "rb") as f:
+        yield from ijson.items(f, LADDER_ENTRIES_PREFIX, use_float=True)
+
+class LadderEntryFinder:
+    """
+    Incremental parser over a ladder response body that finds the first entry matching each query, with its
+    neighbours as prev / next. queries are indexed by account and character name, so each entry costs two hash
+    lookups regardless of the number of queries. only the previous entry is kept, parsing stops once every query
+    is matched and the next neighbours are read, so the work done is proportional to the lowest matched rank
+    rather than the ladder size
+    """
+
+    def __init__(self, queries: List[LadderQuery]):
+        self.queries = list(queries)
+        self.done = False
+        self._by_account: dict[str, list[LadderQuery]] = {}
+        self._by_character: dict[str, list[LadderQuery]] = {}
+        for query in self.queries:
+            if query.account_name:
+                self._by_account.setdefault(query.account_name, []).append(query)
+            else:
+                self._by_character.setdefault(query.character_name, []).append(query)
+        self._entries = ijson.sendable_list()
+        self._parser = ijson.items_coro(self._entries, LADDER_ENTRIES_PREFIX, use_float=True)
+        self._prev = None
+        self._matches: dict[LadderQuery, LadderEntry] = {}
+        self._awaiting_next: list[LadderEntry] = []
+        self._error = None
+
+    def feed(self, chunk: bytes) -> bool:
+        """
+        :return: True once no more input is needed
+        """
+        if self.done:
+            return True
+        try:
+            self._parser.send(chunk)
+        except ijson.JSONError as e:
+            self._error = e
+            self.done = True
+            return True
+        for entry in self._entries:
+            if self._add(entry):
+                break
+        del self._entries[:]
+        return self.done
+
+    def search(self, f):
+        """
+        parses a complete body from a binary file, faster than feeding it in chunks
+        """
+        try:
+            for entry in ijson.items(f, LADDER_ENTRIES_PREFIX, use_float=True):
+                if self._add(entry):
+                    return
+        except ijson.JSONError as e:
+            self._error = e
+        self.done = True
+
+    def _add(self, entry) -> bool:
+        if self._awaiting_next:
+            next_entry = mk_ladder_entry(entry)
+            for match in self._awaiting_next:
+                match.next = next_entry
+            self._awaiting_next = []
+        candidates = self._by_account.get(entry.get("account", {}).get("name"), []) + self._by_character.get(entry.get("character", {}).get("name"), [])
+        for query in candidates:
+            if query in self._matches or not query.matches(entry):
+                continue
+            match = mk_ladder_entry(entry)
+            if self._prev:
+                match.prev = mk_ladder_entry(self._prev)
+            self._matches[query] = match
+            self._awaiting_next.append(match)
+        self._prev = entry
+        self.done = len(self._matches) == len(set(self.queries)) and not self._awaiting_next
+        return self.done
+
+    def results(self) -> dict[LadderQuery, Optional[LadderEntry]]:
+        """
+        :raises LadderFetchError: if the body is not valid JSON
+        """
+        if not self.done:
+            # end of input, matches of the last entry have no next neighbour
+            try:
+                self._parser.close()
+            except ijson.JSONError as e:
+                self._error = e
+            self.done = True
+        if self._error and len(self._matches) < len(set(self.queries)):
+            raise LadderFetchError(f"invalid ladder response: {self._error}")
+        return {query: self._matches.get(query) for query in self.queries}
 
 def mk_ladder_entry(entry) -> LadderEntry:
     char_data = entry["character"]
@@ -0,0 +1,90 @@
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+import ladder_api
+from ladder_api import fetch_data, get_client
+from mock_ladder_server import MockLadderServer
+
+LEAGUE = "Benchmark"
+
+def timed(f, repeat: int, setup=None) -> float:
+    """
+    :return: median seconds of repeat calls of f, setup runs untimed before each call
+    """
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+def peak_memory(f, setup=None) -> int:
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        f()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def benchmark(entries: int, repeat: int, latency: float):
+    with MockLadderServer(entries, latency=latency) as server:
+        client = get_client(server.url)
+        client.cache_ttl = timedelta(0)
+        body_size = len(server.body)
+        targets = {"top": "Character0", "middle": f"Character{entries // 2}", "last": f"Character{entries - 1}", "missing": "NotRanked"}
+
+        def lookup(name):
+            return lambda: fetch_data(character_name=name, league=LEAGUE)
+
+        def new_version():
+            # a changed ladder, forces a full download
+            server.advance()
+
+        def forget():
+            # a cached body that was not looked up yet, e.g. after a restart
+            client.clear_memo()
+
+        lookup(targets["top"])()
+        print(f"\n{entries} entries, {body_size / 1e6:.1f} MB body, {len(server.gzip_body) / 1e6:.1f} MB gzipped, {latency * 1000:.0f}ms latency")
+        print(f"{'target':<10}{'200 (ms)':>12}{'304 (ms)':>12}{'cached (ms)':>14}{'disk parse (ms)':>18}{'peak 200 (MB)':>16}")
+        for label, name in targets.items():
+            fresh = timed(lookup(name), repeat, new_version)
+            revalidated = timed(lookup(name), repeat)
+            client.cache_ttl = timedelta(hours=1)
+            cached = timed(lookup(name), repeat)
+            parsed = timed(lookup(name), repeat, forget)
+            client.cache_ttl = timedelta(0)
+            peak = peak_memory(lookup(name), new_version)
+            print(f"{label:<10}{fresh * 1000:>12.1f}{revalidated * 1000:>12.1f}{cached * 1000:>14.2f}{parsed * 1000:>18.1f}{peak / 1e6:>16.1f}")
+
+        client.cache_ttl = timedelta(hours=1)
+        full_scan = timed(lookup(targets["missing"]), repeat, forget)
+        print(f"parse throughput: {entries / full_scan:,.0f} entries/s, {body_size / full_scan / 1e6:.1f} MB/s")
+        print(f"server: {server.stats}")
+        client.close()
+        ladder_api._client = None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks fetch_data against a local mock ladder API")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 25_000, 50_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the mock server adds to every response")
+    args = parser.parse_args()
+
+    # the client caches responses under user_data, keep them out of the real one
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            for size in args.sizes:
+                benchmark(size, args.repeat, args.latency)
+        finally:
+            os.chdir(cwd)
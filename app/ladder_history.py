@@ -0,0 +1,141 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+import pyarrow as pa
+from db import conn
+from itertools import takewhile
+from ladder_api import LadderResponse, iter_ladder_entries
+
+# entries within this many ranks of a tracked character are recorded
+LADDER_HISTORY_WINDOW = 10
+
+LADDER_BATCH_SCHEMA = pa.schema([
+    ("rank", pa.int32()),
+    ("character_id", pa.string()),
+    ("character_name", pa.string()),
+    ("level", pa.int32()),
+    ("experience", pa.int64()),
+    ("dead", pa.bool_()),
+])
+
+_DIFF_QUERIES = [
+    # new or changed entries
+    """
+    INSERT INTO ladder_history
+    SELECT $fetch_ts, $league, n.rank, n.character_id, n.character_name, n.level, n.experience, n.dead
+    FROM _arrow_ladder_batch n LEFT JOIN (SELECT * FROM ladder_latest WHERE league = $league) l ON l.character_id = n.character_id
+    WHERE l.character_id IS NULL
+        OR (l.rank, l.character_name, l.level, l.experience, l.dead) IS DISTINCT FROM (n.rank, n.character_name, n.level, n.experience, n.dead)
+    """,
+    # entries that dropped off the ladder or out of the recorded window
+    """
+    INSERT INTO ladder_history
+    SELECT $fetch_ts, $league, NULL, character_id, character_name, level, experience, dead
+    FROM ladder_latest
+    WHERE league = $league AND character_id NOT IN (SELECT character_id FROM _arrow_ladder_batch)
+    """,
+    "DELETE FROM ladder_latest WHERE league = $league",
+    "INSERT INTO ladder_latest SELECT $league, rank, character_id, character_name, level, experience, dead FROM _arrow_ladder_batch",
+    "INSERT INTO ladder_fetches VALUES ($fetch_ts, $league, $version, (SELECT count(*) FROM _arrow_ladder_batch))",
+]
+
+@dataclass
+class LadderPoint:
+    fetch_ts: datetime
+    rank: Optional[int]
+    level: int
+    experience: int
+    dead: bool
+
+def mk_ladder_batch(entries) -> pa.Table:
+    columns = {name: [] for name in LADDER_BATCH_SCHEMA.names}
+    for entry in entries:
+        character = entry["character"]
+        columns["rank"].append(entry["rank"])
+        columns["character_id"].append(character["id"])
+        columns["character_name"].append(character["name"])
+        columns["level"].append(character["level"])
+        columns["experience"].append(character["experience"])
+        columns["dead"].append(entry.get("dead", False))
+    return pa.Table.from_pydict(columns, schema=LADDER_BATCH_SCHEMA)
+
+def in_window(rank: int, ranks: list[int], window: int) -> bool:
+    return any(abs(rank - r) <= window for r in ranks)
+
+def record_ladder(response: LadderResponse, ranks: list[int], window: int = LADDER_HISTORY_WINDOW) -> bool:
+    """
+    Records the entries of a ladder response within window ranks of the tracked ranks that changed since the previous
+    recorded fetch of its league. parsing stops after the last rank in a window
+
+    :return: False if this response version was already recorded
+    """
+    if not ranks:
+        return False
+    last_rank = max(ranks) + window
+    cursor = conn.cursor()
+    try:
+        if cursor.execute("SELECT count(*) FROM ladder_fetches WHERE league = ? AND version = ?", [response.league, response.version]).fetchone()[0]:
+            return False
+        entries = takewhile(lambda entry: entry["rank"] <= last_rank, iter_ladder_entries(response.path))
+        cursor.register("_arrow_ladder_batch", mk_ladder_batch(entry for entry in entries if in_window(entry["rank"], ranks, window)))
+        params = {"fetch_ts": response.fetched_at, "league": response.league, "version": response.version}
+        cursor.execute("BEGIN TRANSACTION")
+        try:
+            for query in _DIFF_QUERIES:
+                cursor.execute(query, {name: value for name, value in params.items() if f"${name}" in query})
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        return True
+    finally:
+        cursor.close()
+
+def _character_id(cursor, league: str, character_name: str) -> Optional[str]:
+    row = cursor.execute("""
+        SELECT character_id FROM ladder_history WHERE league = ? AND character_name = ? ORDER BY fetch_ts DESC LIMIT 1
+    """, [league, character_name]).fetchone()
+    return row[0] if row else None
+
+def get_rank_trajectory(league: str, character_name: str, since: datetime = None) -> list[LadderPoint]:
+    """
+    :return: the character's recorded changes since since, starting with its state at since (if known)
+    """
+    if since is None:
+        since = datetime.min
+    cursor = conn.cursor()
+    try:
+        character_id = _character_id(cursor, league, character_name)
+        if character_id is None:
+            return []
+        rows = cursor.execute("""
+            WITH h AS (SELECT * FROM ladder_history WHERE league = $league AND character_id = $character_id)
+            SELECT * FROM (SELECT fetch_ts, rank, level, experience, dead FROM h WHERE fetch_ts <= $since ORDER BY fetch_ts DESC LIMIT 1)
+            UNION ALL
+            SELECT fetch_ts, rank, level, experience, dead FROM h WHERE fetch_ts > $since
+            ORDER BY fetch_ts
+        """, {"league": league, "character_id": character_id, "since": since}).fetchall()
+    finally:
+        cursor.close()
+    return [LadderPoint(*row) for row in rows]
+
+def get_ladder_xph(league: str, character_name: str, window: timedelta = timedelta(hours=6)) -> Optional[float]:
+    """
+    XP/h of a character over the window ending at the latest fetch of its league, None if there is no recorded change
+    within the window to measure from
+    """
+    cursor = conn.cursor()
+    try:
+        latest_fetch = cursor.execute("SELECT max(fetch_ts) FROM ladder_fetches WHERE league = ?", [league]).fetchone()[0]
+    finally:
+        cursor.close()
+    if latest_fetch is None:
+        return None
+    points = get_rank_trajectory(league, character_name, latest_fetch - window)
+    if not points:
+        return None
+    start_ts = max(points[0].fetch_ts, latest_fetch - window)
+    hours = (latest_fetch - start_ts).total_seconds() / 3600
+    if hours <= 0:
+        return None
+    return (points[-1].experience - points[0].experience) / hours
@@ -0,0 +1,108 @@
+import random
+import threading
+import time
+from typing import Callable, Optional
+from ladder_api import LadderFetchError
+
+class TokenBucket:
+    """
+    Allows bursts of up to capacity calls, refilled at rate tokens per second
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        if rate <= 0 or capacity < 1:
+            raise ValueError("rate must be positive and capacity at least 1")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def wait_time(self) -> float:
+        """
+        :return: seconds until a token is available
+        """
+        self._refill()
+        return max(0.0, (1 - self._tokens) / self.rate)
+
+    def take(self) -> bool:
+        self._refill()
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+class LadderPoller:
+    """
+    Runs poll on a single long-lived thread whenever requested. requests made while a poll is pending or in flight are
+    coalesced into one, polls are rate limited by a token bucket and failures (LadderFetchError) are retried with
+    jittered exponential backoff, at least as long as the server's Retry-After. outcomes are published via events as
+    ladder_poll_failed, results are expected to be emitted by poll itself
+    """
+
+    def __init__(self, poll: Callable[[], None], events, rate: float = 1 / 30, burst: int = 2,
+                 backoff: float = 5.0, max_backoff: float = 900.0):
+        self.poll = poll
+        self.events = events
+        self.bucket = TokenBucket(rate, burst)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self._requested = threading.Event()
+        self._stopped = threading.Event()
+        self._retry_at = 0.0
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="ladder-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._requested.set()
+
+    def request(self):
+        self._requested.set()
+
+    def backoff_delay(self) -> float:
+        delay = min(self.max_backoff, self.backoff * 2 ** (self.failures - 1))
+        # equal jitter, keeps at least half the delay while spreading retries
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _wait(self, seconds: float) -> bool:
+        """
+        :return: False if stopped while waiting
+        """
+        return seconds <= 0 or not self._stopped.wait(seconds)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._requested.wait()
+            if self._stopped.is_set():
+                return
+            if not self._wait(self._retry_at - time.monotonic()):
+                return
+            while not self.bucket.take():
+                if not self._wait(self.bucket.wait_time()):
+                    return
+            # requests arriving from here on trigger another poll
+            self._requested.clear()
+            try:
+                self.poll()
+                self.failures = 0
+            except LadderFetchError as e:
+                self.failures += 1
+                delay = max(self.backoff_delay(), e.retry_after or 0)
+                self._retry_at = time.monotonic() + delay
+                print(f"[Error] {e}, retrying in {delay:.0f}s")
+                self.events.emit("ladder_poll_failed", {"error": e, "retry_in": delay})
+                self._requested.set()
+            except Exception as e:
+                print(f"[Error] ladder poll failed: {e}")
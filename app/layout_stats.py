@@ -0,0 +1,98 @@
+import threading
+from dataclasses import dataclass
+from typing import Optional
+import numpy as np
+from db import conn
+from poe_bridge import events
+
+@dataclass
+class LayoutXPH:
+    map_name: str
+    runs: int
+    xph: float # map time weighted mean
+    ci_low: float
+    ci_high: float
+
+class LayoutXPHBootstrap:
+    """
+    Bootstrap confidence intervals of the map time weighted mean xph per map layout. all layouts are resampled at
+    once: every resample is a row of a matrix whose columns are grouped by layout, so each layout draws as many
+    runs as it has from its own runs. results are cached and invalidated per layout
+    """
+
+    def __init__(self, n_resamples: int = 1000, confidence: float = 0.9, max_matrix_size: int = 4_000_000, seed: Optional[int] = None):
+        if not 0 < confidence < 1:
+            raise ValueError("confidence must be in (0, 1)")
+        self.n_resamples = n_resamples
+        self.confidence = confidence
+        self.max_matrix_size = max_matrix_size
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._cache: dict[str, LayoutXPH] = {}
+        # layouts to recompute, None means all of them
+        self._dirty: Optional[set[str]] = None
+
+    def invalidate(self, map_name: Optional[str] = None):
+        with self._lock:
+            if map_name is None:
+                self._dirty = None
+            elif self._dirty is not None:
+                self._dirty.add(map_name)
+
+    def results(self) -> dict[str, LayoutXPH]:
+        with self._lock:
+            if self._dirty is None:
+                self._cache = self._compute()
+            elif self._dirty:
+                for map_name in self._dirty:
+                    self._cache.pop(map_name, None)
+                self._cache.update(self._compute(self._dirty))
+            self._dirty = set()
+            return dict(self._cache)
+
+    def _compute(self, map_names: Optional[set[str]] = None) -> dict[str, LayoutXPH]:
+        where = "AND map_name IN (SELECT unnest($map_names))" if map_names is not None else ""
+        cursor = conn.cursor()
+        columns = cursor.execute(f"""
+            SELECT map_name, xph, map_time FROM (
+                SELECT
+                    data->>'map_name' AS map_name,
+                    CAST(data->>'xph' AS DOUBLE) AS xph,
+                    CAST(data->'span'->>'map_time' AS DOUBLE) AS map_time
+                FROM maps
+                WHERE CAST(data->>'xp_gained' AS BIGINT) > 0
+            )
+            WHERE map_time > 0 {where}
+            ORDER BY map_name
+        """, {"map_names": list(map_names)} if map_names is not None else {}).fetchnumpy()
+        cursor.close()
+        if len(columns["map_name"]) == 0:
+            return {}
+
+        xph = np.asarray(columns["xph"], dtype=np.float64)
+        weights = np.asarray(columns["map_time"], dtype=np.float64)
+        names, offsets, counts = np.unique(np.asarray(columns["map_name"], dtype=object), return_index=True, return_counts=True)
+        group_offsets = np.repeat(offsets, counts)
+        group_counts = np.repeat(counts, counts)
+
+        means = np.empty((self.n_resamples, len(names)))
+        chunk_size = max(1, self.max_matrix_size // len(xph))
+        for chunk_start in range(0, self.n_resamples, chunk_size):
+            chunk = slice(chunk_start, min(chunk_start + chunk_size, self.n_resamples))
+            n_rows = chunk.stop - chunk.start
+            ix = group_offsets + (self._rng.random((n_rows, len(xph))) * group_counts).astype(np.int64)
+            w = weights[ix]
+            means[chunk] = np.add.reduceat(w * xph[ix], offsets, axis=1) / np.add.reduceat(w, offsets, axis=1)
+
+        alpha = (1 - self.confidence) / 2
+        ci_low, ci_high = np.quantile(means, [alpha, 1 - alpha], axis=0)
+        point = np.add.reduceat(weights * xph, offsets) / np.add.reduceat(weights, offsets)
+        return {
+            name: LayoutXPH(name, int(count), float(mean), float(lo), float(hi))
+            for name, count, mean, lo, hi in zip(names, counts, point, ci_low, ci_high)
+        }
+
+layout_xph = LayoutXPHBootstrap()
+
+events.on("map_completed", lambda event: layout_xph.invalidate(event["map"].map_name))
+events.on("map_deleted", lambda event: layout_xph.invalidate(event["map"].map_name))
@@ -0,0 +1,200 @@
+import math
+import threading
+from dataclasses import dataclass
+from typing import Optional
+import numpy as np
+from db import conn
+from poe_bridge import events, get_recent_xp_snapshots
+from settings import config
+from xp_table import experience_table_np, max_level, get_levels_from_xp, get_xp_penalty_multipliers, unapply_xp_penalties
+
+@dataclass
+class LevelETA:
+    level: int
+    # fraction of trajectories that reached the level within max_hours, a lower bound if the simulation stopped once
+    # the percentiles could no longer become known
+    reached: float
+    # percentile -> hours, None if too few trajectories reached the level
+    hours: dict[int, Optional[float]]
+
+@dataclass
+class MapHistory:
+    base_xp: np.ndarray # xp without penalties, negative for xp lost
+    area_level: np.ndarray
+    seconds: np.ndarray # map time plus idle time (load, pause, hideout)
+
+    def __len__(self):
+        return len(self.base_xp)
+
+class LevelingSimulator:
+    """
+    Monte Carlo ETA to reach levels. trajectories replay maps drawn from the recorded history (xp, area level,
+    map and idle time), the xp penalty is removed from the recorded xp and reapplied at the simulated character level.
+    maps are simulated in batches of batch_size per trajectory, penalties within a batch are corrected once
+    after the cumulative xp is known, which is exact unless a batch crosses more than one level.
+    trajectories are simulated for at most max_hours, and dropped once they can not reach a level within it even at the
+    best recorded rate
+    """
+
+    def __init__(self, history_maps: int = 500, trajectories: int = 2000, max_hours: float = 200, batch_size: int = 16,
+                 percentiles: tuple[int, ...] = (10, 50, 90), seed: Optional[int] = None):
+        self.history_maps = history_maps
+        self.trajectories = trajectories
+        self.max_hours = max_hours
+        self.batch_size = batch_size
+        self.percentiles = percentiles
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._history: Optional[MapHistory] = None
+        self._latest: dict[int, LevelETA] = {}
+
+    def invalidate(self):
+        self._history = None
+
+    def latest(self) -> dict[int, LevelETA]:
+        return self._latest
+
+    def history(self) -> MapHistory:
+        history = self._history
+        if history is None:
+            self._history = history = self._load_history()
+        return history
+
+    def _load_history(self) -> MapHistory:
+        cursor = conn.cursor()
+        columns = cursor.execute("""
+            SELECT xp_start, xp_gained, area_level, map_time + load_time + pause_time + hideout_time AS seconds FROM (
+                SELECT
+                    CAST(data->>'xp_start' AS BIGINT) AS xp_start,
+                    CAST(data->>'xp_gained' AS BIGINT) AS xp_gained,
+                    CAST(data->>'area_level' AS INTEGER) AS area_level,
+                    CAST(data->'span'->>'map_time' AS DOUBLE) AS map_time,
+                    CAST(data->'span'->>'load_time' AS DOUBLE) AS load_time,
+                    CAST(data->'span'->>'pause_time' AS DOUBLE) AS pause_time,
+                    CAST(data->'span'->>'hideout_time' AS DOUBLE) AS hideout_time,
+                    CAST(data->'span'->>'end' AS TIMESTAMP) AS end_ts
+                FROM maps
+            )
+            -- xp_gained is 0 when the xp at the end of the map is unknown, xp lost (deaths) is kept so the draws are not optimistic
+            WHERE xp_start IS NOT NULL AND xp_gained != 0 AND xp_start + xp_gained >= 0 AND map_time > 0 AND area_level BETWEEN 0 AND 100
+            ORDER BY end_ts DESC
+            LIMIT $limit
+        """, {"limit": self.history_maps}).fetchnumpy()
+        cursor.close()
+        xp_start = np.asarray(columns["xp_start"], dtype=np.int64)
+        area_level = np.asarray(columns["area_level"], dtype=np.int64)
+        base_xp = unapply_xp_penalties(xp_start, xp_start + np.asarray(columns["xp_gained"], dtype=np.int64), area_level)
+        return MapHistory(base_xp.astype(np.float64), area_level, np.asarray(columns["seconds"], dtype=np.float64))
+
+    def simulate(self, xp: int, target_levels) -> dict[int, LevelETA]:
+        """
+        :param xp: current experience
+        :param target_levels: levels to estimate the ETA for, levels already reached are skipped
+        """
+        history = self.history()
+        targets = sorted({level for level in target_levels if 1 < level <= max_level and experience_table_np[level - 1] > xp})
+        if not targets or not len(history):
+            return {}
+        thresholds = experience_table_np[np.array(targets) - 1].astype(np.float64)
+        horizon = self.max_hours * 3600
+        # upper bound of the xp per second at a level and above, over every map of the history
+        rates = np.maximum(history.base_xp, 0) * get_xp_penalty_multipliers(np.arange(1, max_level + 1)[:, None], history.area_level) / history.seconds
+        best_rate = np.maximum.accumulate(rates.max(axis=1)[::-1])[::-1]
+
+        n = self.trajectories
+        # unreached is treated as never, so a percentile is unknown if less than that share of trajectories reached the level
+        needed = max(1, math.ceil(min(self.percentiles) / 100 * n))
+        xp_now = np.full(n, float(xp))
+        elapsed = np.zeros(n)
+        # time at which each trajectory reached each target
+        eta = np.full((n, len(targets)), np.nan)
+        active = np.arange(n)
+        while True:
+            # trajectories that can still reach each target within the horizon, xp lost can drop them a level
+            level = np.clip(get_levels_from_xp(xp_now[active]) - 1, 1, max_level)
+            left = horizon - elapsed[active, None]
+            reachable = np.isnan(eta[active]) & (left > 0) & (xp_now[active, None] + best_rate[level - 1, None] * left >= thresholds)
+            # stop simulating targets whose percentiles are already known or can no longer become known
+            reached = (~np.isnan(eta)).sum(axis=0)
+            pending = reachable.sum(axis=0)
+            simulated = (pending > 0) & (reached + pending >= needed)
+            active = active[reachable[:, simulated].any(axis=1)]
+            if not len(active):
+                break
+
+            draws = self._rng.integers(0, len(history), (len(active), self.batch_size))
+            base_xp = history.base_xp[draws]
+            area_level = history.area_level[draws]
+            start = xp_now[active, None]
+            # predict with the level at the start of the batch, then correct with the level before each map
+            gained = base_xp * get_xp_penalty_multipliers(np.clip(get_levels_from_xp(start), 1, max_level), area_level)
+            before = start + np.cumsum(gained, axis=1) - gained
+            gained = base_xp * get_xp_penalty_multipliers(np.clip(get_levels_from_xp(before), 1, max_level), area_level)
+            after = start + np.cumsum(gained, axis=1)
+            before = after - gained
+            seconds = history.seconds[draws]
+            elapsed_after = elapsed[active, None] + np.cumsum(seconds, axis=1)
+
+            for t, threshold in enumerate(thresholds):
+                # xp lost later in the batch does not undo reaching the level
+                pending = np.isnan(eta[active, t]) & (after.max(axis=1) >= threshold)
+                if not pending.any():
+                    continue
+                rows = np.flatnonzero(pending)
+                col = np.argmax(after[rows] >= threshold, axis=1)
+                # interpolate within the map that crossed the threshold
+                fraction = (threshold - before[rows, col]) / gained[rows, col]
+                reached_at = elapsed_after[rows, col] - seconds[rows, col] * (1 - fraction)
+                within = reached_at <= horizon
+                eta[active[rows[within]], t] = reached_at[within]
+
+            xp_now[active] = after[:, -1]
+            elapsed[active] = elapsed_after[:, -1]
+
+        results = {}
+        eta = np.nan_to_num(eta, nan=np.inf)
+        for t, level in enumerate(targets):
+            hours = {}
+            for p in self.percentiles:
+                value = np.percentile(eta[:, t], p, method="inverted_cdf")
+                hours[p] = float(value) / 3600 if np.isfinite(value) else None
+            results[level] = LevelETA(level, float(np.isfinite(eta[:, t]).mean()), hours)
+        return results
+
+    def refresh(self, xp: int, target_levels=()) -> dict[int, LevelETA]:
+        """
+        simulates the next level and target_levels, the results are cached for latest()
+        """
+        next_level = int(get_levels_from_xp(xp)) + 1
+        with self._lock:
+            self._latest = self.simulate(xp, [next_level, *target_levels])
+        return self._latest
+
+leveling_sim = LevelingSimulator()
+_started = False
+
+def _refresh_leveling_eta():
+    snapshots = get_recent_xp_snapshots()
+    if not snapshots:
+        return
+    try:
+        target_level = config.get("eta_target_level")
+        leveling_sim.refresh(snapshots[-1].xp, [target_level] if target_level else [])
+    except Exception as e:
+        print(f"[Error] leveling ETA simulation failed: {e}")
+
+def _on_map_changed(_):
+    leveling_sim.invalidate()
+    threading.Thread(target=_refresh_leveling_eta, daemon=True).start()
+
+def start_leveling_eta():
+    """
+    keeps leveling_sim refreshed as maps complete or get deleted and runs a first simulation in the background
+    """
+    global _started
+    if _started:
+        return
+    _started = True
+    events.on("map_completed", _on_map_changed)
+    events.on("map_deleted", _on_map_changed)
+    threading.Thread(target=_refresh_leveling_eta, daemon=True).start()
@@ -0,0 +1,169 @@
+import argparse
+import gzip
+import hashlib
+import json
+import random
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CLASSES = ["Warrior", "Ranger", "Huntress", "Witch", "Sorceress", "Mercenary", "Monk", "Druid"]
+
+def mk_ladder(entries: int, seed: int = 0) -> dict:
+    """
+    generates a ladder in the shape of the game-ladder API response, ordered by experience
+    """
+    rng = random.Random(seed)
+    experience = sorted((rng.randint(0, 4_250_334_444) for _ in range(entries)), reverse=True)
+    ladder_entries = []
+    for i, xp in enumerate(experience):
+        account = {"name": f"Account{i}#{rng.randint(1000, 9999)}", "challenges": {"set": "Ancestral", "completed": rng.randint(0, 40), "max": 40}}
+        if rng.random() < 0.05:
+            account["twitch"] = {"name": f"streamer{i}"}
+            if rng.random() < 0.3:
+                account["twitch"]["stream"] = {"name": f"streamer{i}", "status": "mapping", "image": f"https://example.invalid/{i}.jpg"}
+        ladder_entries.append({
+            "rank": i + 1,
+            "dead": rng.random() < 0.01,
+            "public": rng.random() < 0.9,
+            "character": {"id": f"{i:064x}", "name": f"Character{i}", "level": min(100, 1 + xp // 42_500_000), "class": rng.choice(CLASSES), "experience": xp},
+            "account": account
+        })
+    return {"context": {"ladder": {"total": entries, "cached_since": formatdate(usegmt=True), "entries": ladder_entries}}}
+
+class MockLadderServer:
+    """
+    Local stand-in for the ladder API. serves a generated ladder for any league at http://127.0.0.1:port/<league>,
+    with ETag / Last-Modified revalidation, optional gzip and injected latency and errors
+    """
+
+    def __init__(self, entries: int = 10_000, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 503, retry_after: int = None, compress: bool = True, port: int = 0, seed: int = 0):
+        self.entries = entries
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.compress = compress
+        self.stats = {"requests": 0, "200": 0, "304": 0, "errors": 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ladder = mk_ladder(entries, seed)
+        self._publish()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._mk_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/"
+
+    def start(self) -> 'MockLadderServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def advance(self, players: int = 100, max_xp: int = 5_000_000):
+        """
+        gives random players xp and re-ranks the ladder, changing its ETag
+        """
+        entries = self._ladder["context"]["ladder"]["entries"]
+        for entry in self._rng.sample(entries, min(players, len(entries))):
+            entry["character"]["experience"] = min(4_250_334_444, entry["character"]["experience"] + self._rng.randint(1, max_xp))
+        entries.sort(key=lambda entry: entry["character"]["experience"], reverse=True)
+        for i, entry in enumerate(entries):
+            entry["rank"] = i + 1
+        self._publish()
+
+    def _publish(self):
+        body = json.dumps(self._ladder, separators=(",", ":")).encode()
+        with self._lock:
+            self.body = body
+            self.gzip_body = gzip.compress(body, compresslevel=5) if self.compress else None
+            self.etag = f'"{hashlib.sha1(body).hexdigest()}"'
+            self.last_modified = formatdate(usegmt=True)
+
+    def _count(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _mk_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server._count("requests")
+                with server._lock:
+                    body, gzip_body, etag, last_modified = server.body, server.gzip_body, server.etag, server.last_modified
+                    fail = server._rng.random() < server.error_rate
+                delay = server.latency + (server._rng.uniform(0, server.jitter) if server.jitter else 0)
+                if delay:
+                    time.sleep(delay)
+                if fail:
+                    server._count("errors")
+                    self.send_response(server.error_status)
+                    if server.retry_after is not None:
+                        self.send_header("Retry-After", str(server.retry_after))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if self.headers.get("If-None-Match") == etag or (not self.headers.get("If-None-Match") and self.headers.get("If-Modified-Since") == last_modified):
+                    server._count("304")
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                server._count("200")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", last_modified)
+                if gzip_body is not None and "gzip" in self.headers.get("Accept-Encoding", ""):
+                    body = gzip_body
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local mock of the ladder API")
+    parser.add_argument("--entries", type=int, default=10_000)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random seconds added on top of latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--retry-after", type=int, default=None)
+    parser.add_argument("--update-interval", type=float, default=0.0, help="seconds between ladder updates, 0 to never update")
+    args = parser.parse_args()
+
+    server = MockLadderServer(args.entries, args.latency, args.jitter, args.error_rate, args.error_status, args.retry_after, port=args.port)
+    server.start()
+    print(f"[Info] serving {args.entries} ladder entries at {server.url}<league>, set the ladder API URL to {server.url}")
+    try:
+        while True:
+            time.sleep(args.update_interval or 3600)
+            if args.update_interval:
+                server.advance()
+    except KeyboardInterrupt:
+        server.stop()
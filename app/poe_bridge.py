@@ -10,8 +10,18 @@ import pygetwindow as gw
 import threading
 import psutil
 from db import conn
-from ladder_api import fetch_data
-from instance_tracker import InstanceTracker, MapInstance, XPSnapshot
+from state_store import state_store
+from ladder_api import LadderEntry, LadderQuery, get_client as get_ladder_client
+from ladder_poller import LadderPoller
+from ladder_history import record_ladder
+from rank_race import rank_race
+from xp_fusion import XPFusion
+from instance_tracker import InstanceTracker, MapInstance, XPSnapshot, XPSegment
+from xp_compaction import CompactionPolicy, compact_xp_snapshots
+from xph_estimator import TrimmedXPHEstimator
+from idle_stats import IdleStats
+from warm_start import WARM_START_VERSION, WarmStartState, load_warm_start, save_warm_start
+import atexit
 from collections import deque
 from dataclasses import dataclass
 from PIL import Image
@@ -20,13 +30,29 @@ from PySide6.QtGui import QPixmap, QImage
 
 USER_DATA_PATH = "user_data"
 LOG_FILE_PATH = os.path.join(USER_DATA_PATH, "poe_xp_tracker.json")
+WARM_START_PATH = os.path.join(USER_DATA_PATH, "warm_start.bin")
+WARM_START_INTERVAL = timedelta(minutes=1)
+# replaying more than this from the snapshot's log offset is slower than a cold start
+WARM_START_MAX_REPLAY_BYTES = 5 * 1024 * 1024
 os.makedirs(USER_DATA_PATH, exist_ok=True)
 
 _cached_window = None
-_last_ladder_capture = None
+_last_compaction = None
+_log_file = None
+_log_offset = None
+COMPACTION_INTERVAL = timedelta(hours=24)
 _tracker = InstanceTracker()
 _recent_encounters = deque(maxlen=100)
 events = _tracker.events
+xph_estimators = {
+    "recent": TrimmedXPHEstimator(max_maps=100),
+    "hour": TrimmedXPHEstimator(max_age=timedelta(hours=1)),
+    "session": TrimmedXPHEstimator(since=datetime.now()),
+}
+idle_stats = IdleStats(max_maps=config.get("idle_stats_window"))
+xp_fusion = XPFusion()
+# the latest ladder entry of the own character, persisted along with the tracker state
+_current_ladder_entry: Optional[LadderEntry] = None
 
 @dataclass
 class Encounter:
@@ -36,6 +62,7 @@ class Encounter:
     data: {}
     screenshot_path: Optional[str]
     snapshot: Optional[XPSnapshot]
+    map_id: Optional[str] = None
 
     @functools.cached_property
     def q_thumbnail(self):
@@ -54,7 +81,8 @@ class Encounter:
             "ts": self.ts.isoformat(),
             "data": self.data,
             "screenshot_path": self.screenshot_path,
-            "snapshot": self.snapshot.to_dict() if self.snapshot else None
+            "snapshot": self.snapshot.to_dict() if self.snapshot else None,
+            "map_id": self.map_id
         }
 
     @classmethod
@@ -65,13 +93,20 @@ class Encounter:
             ts=datetime.fromisoformat(data["ts"]),
             data=data["data"],
             screenshot_path=data["screenshot_path"],
-            snapshot=None #XPSnapshot.from_dict(data["snapshot"]) if data["snapshot"] else None
+            snapshot=None, #XPSnapshot.from_dict(data["snapshot"]) if data["snapshot"] else None
+            map_id=data.get("map_id")
         )
     
     @classmethod
     def from_row(cls, id, data):
         return cls.from_dict(id, json.loads(data))
 
+    def __getstate__(self):
+        # q_thumbnail is cached in __dict__ and holds a QImage, which can't be pickled
+        state = self.__dict__.copy()
+        state.pop("q_thumbnail", None)
+        return state
+
 def find_poe_pid():
     procs = psutil.process_iter(['pid', 'name'])
     for name in ["PathOfExile.exe", "PathOfExile_x64.exe", "PathOfExile2.exe", "PathOfExile2_x64.exe", "Path of Exile", "Path of Exile 2"]:
@@ -167,21 +202,38 @@ def get_recent_maps():
 def get_recent_xp_snapshots():
     return _tracker.recent_xp_snapshots
 
+def get_recent_xp_segments():
+    return _tracker.recent_xp_segments
+
 def get_recent_encounters():
     return _recent_encounters
 
 def get_current_map():
     return _tracker.get_current_map()
 
-def get_recent_xph():
-    maps = list(filter(lambda m: m.xph, get_recent_maps()))
-    sorted_maps = sorted(maps, key=lambda m: m.xph)
-    trim_count = len(sorted_maps) // 10  # Top and bottom 10%
-    trimmed_maps = sorted_maps[trim_count: -trim_count]
-    # use float to avoid overflow
-    total_weight = sum(float(m.span.map_time().total_seconds()) for m in trimmed_maps)
-    weighted_avg = sum(float(m.xph) * float(m.span.map_time().total_seconds()) for m in trimmed_maps)
-    return weighted_avg / total_weight
+def get_map_xp_snapshots(map_id: str) -> list[XPSnapshot]:
+    rows = conn.execute("SELECT id, data FROM xp_snapshots WHERE map_id = ? ORDER BY CAST(data->>'ts' AS TIMESTAMP)", [map_id]).fetchall()
+    return [XPSnapshot.from_row(row[0], row[1]) for row in rows]
+
+def get_map_xp_segments(map_id: str) -> list[XPSegment]:
+    rows = conn.execute("SELECT id, data FROM xp_segments WHERE map_id = ? ORDER BY CAST(data->>'start_ts' AS TIMESTAMP)", [map_id]).fetchall()
+    return [XPSegment.from_row(row[0], row[1]) for row in rows]
+
+def get_map_encounters(map_id: str) -> list[Encounter]:
+    rows = conn.execute("SELECT id, data FROM encounters WHERE map_id = ? ORDER BY CAST(data->>'ts' AS TIMESTAMP)", [map_id]).fetchall()
+    return [Encounter.from_row(row[0], row[1]) for row in rows]
+
+def get_recent_xph(window: str = "recent") -> float:
+    """
+    10% trimmed, map time weighted xph over the given window (recent, hour or session), 0 if there are no maps
+    """
+    return xph_estimators[window].value()
+
+def get_idle_stats():
+    """
+    cached median and p90 of idle_fraction, load_time, pause_time and hideout_time (seconds), None if there are no maps
+    """
+    return idle_stats.summary()
 
 def parse_all_maps_from_log(log_file=None):
     if not log_file:
@@ -204,6 +256,7 @@ def parse_all_maps_from_log(log_file=None):
 def delete_map(map: MapInstance):
     conn.execute("DELETE FROM maps WHERE id = ?", [map.id])
     _tracker.recent_maps.remove(map)
+    events.emit("map_deleted", {"map": map})
 
 def update_map(map: MapInstance):
     pass
@@ -213,24 +266,90 @@ def set_next_waystone(item: Item):
         raise TypeError("item must be an Item object")
 
     _tracker.set_next_waystone(item)
-    _update_state(item.id, "next_waystone", item)
+    _save_tracker_state()
 
 def add_encounter(encounter: Encounter):    
-    conn.execute("INSERT INTO encounters VALUES (?, ?)", [encounter.id, encounter.to_dict()])
+    conn.execute("INSERT INTO encounters (id, data, map_id) VALUES (?, ?, ?)", [encounter.id, encounter.to_dict(), encounter.map_id])
     _recent_encounters.append(encounter)
     events.emit("encounter_detected", {"encounter": encounter})
 
 def init():
-    _load_state()
-    threading.Thread(target=_observe_log, daemon=True).start()
+    warm_start = _restore_warm_start()
+    if not warm_start:
+        _load_state()
+    threading.Thread(target=_observe_log, args=(warm_start.log_offset if warm_start else None,), daemon=True).start()
     threading.Thread(target=_observe_focus, daemon=True).start()
     events.on("xp_snapshot", _on_xp_snapshot)
+    events.on("xp_segment", _on_xp_segment)
     events.on("map_completed", _on_map_completed)
     events.on("map_entered", _on_map_entered)
-    events.on("map_entered", lambda _: threading.Thread(target=_capture_ladder_data, daemon=True).start())
-    threading.Thread(target=_capture_ladder_data, daemon=True).start()
+    events.on("map_deleted", _on_map_deleted)
+    events.on("hideout_entered", lambda _: _schedule_compaction())
+    events.on("map_entered", lambda _: ladder_poller.request())
+    ladder_poller.start()
+    ladder_poller.request()
+    _schedule_compaction()
+    atexit.register(_save_warm_start)
+
+def _row_counts():
+    return tuple(conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0] for table in ["maps", "xp_snapshots", "xp_segments", "encounters"])
+
+def _restore_warm_start() -> Optional[WarmStartState]:
+    """
+    Restores in-memory state from the warm start snapshot, returns None if the snapshot is missing or stale
+    """
+    state = load_warm_start(WARM_START_PATH)
+    if not state:
+        return None
+    try:
+        log_file = find_poe_logfile()
+        log_size = os.path.getsize(log_file)
+    except Exception as e:
+        print(f"[Info] ignoring warm start snapshot, log file unavailable: {e}")
+        return None
+    if state.log_file != log_file or not (state.log_offset <= log_size <= state.log_offset + WARM_START_MAX_REPLAY_BYTES):
+        print("[Info] ignoring stale warm start snapshot, log file changed")
+        return None
+    if state.row_counts != _row_counts():
+        print("[Info] ignoring stale warm start snapshot, database changed")
+        return None
+
+    _stamp_map_ids()
+    _tracker.recent_maps.extend(state.recent_maps)
+    _tracker.recent_xp_snapshots.extend(state.recent_xp_snapshots)
+    _tracker.recent_xp_segments.extend(state.recent_xp_segments)
+    _recent_encounters.extend(state.recent_encounters)
+    _tracker._current_map = state.current_map
+    _load_current_ladder_entry(state_store.get("current_ladder_entry"))
+    if state.next_waystone:
+        _tracker.set_next_waystone(state.next_waystone)
+    _reset_estimators()
+    print(f"[Info] Restored warm start snapshot from {state.written_at}")
+    return state
+
+def _save_warm_start():
+    if _log_file is None or _log_offset is None:
+        return
+    try:
+        state = WarmStartState(
+            version=WARM_START_VERSION,
+            written_at=datetime.now(),
+            log_file=_log_file,
+            log_offset=_log_offset,
+            row_counts=_row_counts(),
+            recent_maps=list(_tracker.recent_maps),
+            recent_xp_snapshots=list(_tracker.recent_xp_snapshots),
+            recent_xp_segments=list(_tracker.recent_xp_segments),
+            recent_encounters=list(_recent_encounters),
+            current_map=_tracker.get_current_map(),
+            next_waystone=_tracker.get_next_waystone()
+        )
+        save_warm_start(WARM_START_PATH, state)
+    except Exception as e:
+        print(f"[Error] failed to save warm start snapshot: {e}")
 
 def _load_state():
+    _stamp_map_ids()
     # recent maps and xp-snapshots are ordered oldest to newest, but we want the 100 most recent ones, therefore, we extendLeft
     _tracker.recent_maps.extendleft(
         MapInstance.from_row(row[0], row[1])
@@ -240,50 +359,152 @@ def _load_state():
         XPSnapshot.from_row(row[0], row[1])
         for row in conn.execute("SELECT id, data FROM xp_snapshots ORDER BY data->'ts' DESC LIMIT 100").fetchall()
     )
+    _tracker.recent_xp_segments.extendleft(
+        XPSegment.from_row(row[0], row[1])
+        for row in conn.execute("SELECT id, data FROM xp_segments ORDER BY data->'start_ts' DESC LIMIT 100").fetchall()
+    )
     _recent_encounters.extendleft(
         Encounter.from_row(row[0], row[1])
         for row in conn.execute("SELECT id, data FROM encounters ORDER BY data->'ts' DESC LIMIT 100").fetchall()
     )
-    for (id, field, data) in conn.execute("SELECT id, field, data FROM instance_manager_state").fetchall():
-        if field == "current_map":
-            _tracker._current_map = MapInstance.from_row(id, data)
-            print(f"[Info] Loaded current map: {_tracker._current_map.map_name}")
-        elif field == "next_waystone":
-            _tracker.set_next_waystone(Item.from_row(data))
+    state = state_store.get_many(["current_map", "next_waystone", "current_ladder_entry"])
+    _load_current_ladder_entry(state["current_ladder_entry"])
+    if state["current_map"]:
+        _tracker._current_map = MapInstance.from_dict(state["current_map"]["id"], state["current_map"])
+        print(f"[Info] Loaded current map: {_tracker._current_map.map_name}")
+    if state["next_waystone"]:
+        _tracker.set_next_waystone(Item.from_dict(state["next_waystone"]))
+    _reset_estimators()
+
+def _load_current_ladder_entry(data):
+    global _current_ladder_entry
+    _current_ladder_entry = LadderEntry.from_dict(data) if data else None
+
+def _reset_estimators():
+    for estimator in xph_estimators.values():
+        estimator.reset(_tracker.recent_maps)
+    # idle stats may span more maps than are kept in memory, only their span columns are loaded
+    rows = conn.execute("""
+        SELECT id, map_time, load_time, pause_time, hideout_time FROM (
+            SELECT
+                id,
+                CAST(data->'span'->>'start' AS TIMESTAMP) AS start_ts,
+                CAST(data->'span'->>'map_time' AS DOUBLE) AS map_time,
+                CAST(data->'span'->>'load_time' AS DOUBLE) AS load_time,
+                CAST(data->'span'->>'pause_time' AS DOUBLE) AS pause_time,
+                CAST(data->'span'->>'hideout_time' AS DOUBLE) AS hideout_time
+            FROM maps
+            WHERE CAST(data->>'xph' AS DOUBLE) != 0 AND data->'span'->>'map_time' IS NOT NULL
+            ORDER BY start_ts DESC
+            LIMIT ?
+        ) ORDER BY start_ts
+    """, [idle_stats.max_maps]).fetchall()
+    idle_stats.reset(rows)
+    for snapshot in _tracker.recent_xp_snapshots:
+        if snapshot.source == "ocr":
+            xp_fusion.add_ocr(snapshot.xp, snapshot.ts)
+
+def _stamp_map_ids():
+    """
+    Assigns rows that predate map_id stamping to the map whose span contains them, via an asof join over the map spans
+    """
+    for table, ts_field in [("xp_snapshots", "ts"), ("encounters", "ts"), ("xp_segments", "start_ts")]:
+        conn.execute(f"""
+            UPDATE {table} SET map_id = m.map_id, data = json_merge_patch({table}.data, json_object('map_id', m.map_id))
+            FROM (
+                SELECT r.id, spans.id AS map_id
+                FROM (SELECT id, CAST(data->>'{ts_field}' AS TIMESTAMP) AS ts FROM {table} WHERE map_id IS NULL) r
+                ASOF JOIN map_spans spans ON r.ts >= spans.start_ts
+                WHERE r.ts <= spans.end_ts
+            ) m
+            WHERE {table}.id = m.id
+        """)
 
 def _on_map_completed(event):
     m = event["map"]
     conn.execute("INSERT INTO maps VALUES (?, ?)", [m.id, m.to_dict()])
+    for estimator in xph_estimators.values():
+        estimator.add(m)
+    idle_stats.add(m)
+
+def _on_map_deleted(event):
+    for estimator in xph_estimators.values():
+        estimator.remove(event["map"].id)
+    idle_stats.remove(event["map"].id)
 
 def _on_map_entered(event):
-    _update_state(event["map"].id, "current_map", event["map"])
+    _save_tracker_state()
 
 def _on_xp_snapshot(event):
     snapshot = event["snapshot"]
-    conn.execute("INSERT INTO xp_snapshots VALUES (?, ?)", [snapshot.id, snapshot.to_dict()])
-
-def _update_state(id, field, object):
-    conn.execute("INSERT INTO instance_manager_state (id, field, data) VALUES (?, ?, ?) ON CONFLICT (field) DO UPDATE SET id = EXCLUDED.id, data = EXCLUDED.data", 
-        [id, field, object.to_dict() if hasattr(object, "to_dict") else object])
-
-def _observe_log():
+    conn.execute("INSERT INTO xp_snapshots (id, data, map_id) VALUES (?, ?, ?)", [snapshot.id, snapshot.to_dict(), snapshot.map_id])
+    if snapshot.source == "ocr":
+        xp_fusion.add_ocr(snapshot.xp, snapshot.ts)
+
+def _on_xp_segment(event):
+    segment = event["segment"]
+    conn.execute("INSERT INTO xp_segments (id, map_id, data) VALUES (?, ?, ?)", [segment.id, segment.map_id, segment.to_dict()])
+
+def _save_tracker_state():
+    # entering a map consumes the next waystone, so the tracker and gui state are always written as one snapshot
+    current_map = _tracker.get_current_map()
+    next_waystone = _tracker.get_next_waystone()
+    state_store.put_many({
+        "current_map": {"id": current_map.id, **current_map.to_dict()} if current_map else None,
+        "next_waystone": next_waystone.to_dict() if next_waystone else None,
+        "current_ladder_entry": _current_ladder_entry.to_dict() if _current_ladder_entry else None
+    })
+
+def _schedule_compaction():
+    global _last_compaction
+    if not config.get("compact_xp_snapshots") or not in_hideout():
+        return
+    if _last_compaction and datetime.now() - _last_compaction < COMPACTION_INTERVAL:
+        return
+    _last_compaction = datetime.now()
+    threading.Thread(target=_compact_xp_snapshots, daemon=True).start()
+
+def _compact_xp_snapshots():
+    try:
+        policy = CompactionPolicy(full_resolution=timedelta(days=config.get("xp_snapshot_full_resolution_days")))
+        removed = compact_xp_snapshots(policy)
+        print(f"[Info] compacted xp_snapshots, removed {removed} snapshots")
+    except Exception as e:
+        print(f"[Error] xp_snapshots compaction failed: {e}")
+
+def _observe_log(offset: Optional[int] = None):
     log_file = find_poe_logfile()
     print(f"[Monitoring Log File] {log_file}")
-    _tracker.process_log_lines_rev(_read_log_rev(log_file))
-    _tracker.process_log_lines(_log_updates_generator(log_file))
+    if offset is None:
+        _tracker.process_log_lines_rev(_read_log_rev(log_file))
+    _tracker.process_log_lines(_log_updates_generator(log_file, offset))
 
-def _log_updates_generator(log_file):
-     with open(log_file, "r", encoding="utf-8") as f:
+def _log_updates_generator(log_file, offset: Optional[int] = None):
+    global _log_file, _log_offset
+    with open(log_file, "rb") as f:
         if not config.get("default_log_file"):
             config.update({"default_log_file": log_file})
-        # Monitor the log file for new lines, ensure we start at the end of the file even if poe is not running
-        f.seek(0, os.SEEK_END)
+        # Monitor the log file for new lines, ensure we start at the end of the file even if poe is not running,
+        # unless resuming from a warm start snapshot
+        if offset is None:
+            f.seek(0, os.SEEK_END)
+        else:
+            f.seek(offset)
+        _log_file, _log_offset = log_file, f.tell()
+        last_save = datetime.now()
         while True:
             line = f.readline()
-            if not line:
+            if not line.endswith(b"\n"):
+                # incomplete line, wait for the rest of it
+                f.seek(_log_offset)
+                # snapshots are taken in between lines, so the offset always matches the tracker's state
+                if datetime.now() - last_save >= WARM_START_INTERVAL:
+                    _save_warm_start()
+                    last_save = datetime.now()
                 time.sleep(0.5)
                 continue
-            yield line
+            yield line.decode("utf-8", errors="replace")
+            _log_offset = f.tell()
 
 def _read_log_rev(log_file, limit=5000):
     with open(log_file, "rb") as f:
@@ -319,20 +540,73 @@ def _observe_focus():
                     _tracker.pause()
             time.sleep(1)
 
-def _capture_ladder_data():
-    global _last_ladder_capture
-    if _last_ladder_capture and datetime.now() - _last_ladder_capture < timedelta(seconds=30):
-        return
-    _last_ladder_capture = datetime.now()
+def _poll_ladder():
     default_league = config.get("default_league")
+    if not default_league:
+        return
     character_name = config.get("character_name")
     account_name = config.get("account_name")
-    if default_league and (character_name or account_name):
-        ladder_data = fetch_data(character_name=character_name, account_name=account_name, league=default_league)
-        if ladder_data:
-            xp = ladder_data.character.experience
-            if config.get("apply_ladder_xp_snapshot"):
-                _tracker.apply_xp_snapshot(xp, source="ladder")
-            events.emit("ladder_data", {"ladder_data": ladder_data})
+    self_query = LadderQuery(account_name, character_name) if character_name or account_name else None
+    queries = get_ladder_watchlist()
+    if self_query:
+        queries = [self_query] + [query for query in queries if query != self_query]
+    if not queries:
+        return
+    ladder_client = get_ladder_client(config.get("ladder_api_url"))
+    entries = ladder_client.find_entries(default_league, queries)
+    # the response is cached, this only reads its metadata
+    response = ladder_client.fetch(default_league)
+    self_entry = entries.get(self_query) if self_query else None
+    for query, ladder_data in entries.items():
+        if not ladder_data:
+            continue
+        is_self = query == self_query
+        if is_self:
+            _set_current_ladder_entry(ladder_data)
+            point = xp_fusion.add_ladder(ladder_data.character.experience, response.fetched_at)
+            if point and config.get("apply_ladder_xp_snapshot"):
+                _apply_ladder_xp(point)
+        events.emit("ladder_data", {"ladder_data": ladder_data, "is_self": is_self})
+    if config.get("record_ladder_history"):
+        recorded = record_ladder(response, [entry.rank for entry in entries.values() if entry])
+        if self_entry and (recorded or rank_race.latest() is None):
+            _update_rank_race(default_league, self_entry.character.name)
+
+def _apply_ladder_xp(point):
+    """
+    applies a back-dated ladder reading as a snapshot if it is newer than the latest snapshot, older readings are
+    already covered by ocr and would be attributed to the wrong segments
+    """
+    snapshots = get_recent_xp_snapshots()
+    if snapshots and (point.ts <= snapshots[-1].ts or point.xp < snapshots[-1].xp):
+        return
+    _tracker.apply_xp_snapshot(point.xp, point.ts, source="ladder")
+
+def _update_rank_race(league: str, character_name: str):
+    own_xph = None
+    own_experience = None
+    idle_fraction = get_idle_stats()["idle_fraction"]
+    if get_recent_xph() > 0 and idle_fraction:
+        # map time xph to wall clock, as the ladder measures it
+        own_xph = get_recent_xph() * (1 - idle_fraction.median)
+    if get_recent_xp_snapshots():
+        own_experience = get_recent_xp_snapshots()[-1].xp
+    race = rank_race.update(league, character_name, own_xph, own_experience)
+    if race:
+        events.emit("rank_race", {"rank_race": race})
+
+def _set_current_ladder_entry(ladder_entry: LadderEntry):
+    global _current_ladder_entry
+    _current_ladder_entry = ladder_entry
+    _save_tracker_state()
+
+def get_current_ladder_entry() -> Optional[LadderEntry]:
+    return _current_ladder_entry
+
+def get_ladder_watchlist() -> list[LadderQuery]:
+    watchlist = config.get("ladder_watchlist") or ""
+    return list(dict.fromkeys(LadderQuery.parse(name) for name in watchlist.split(",") if name.strip()))
+
+ladder_poller = LadderPoller(_poll_ladder, events)
 
 init()
\ No newline at end of file
@@ -0,0 +1,144 @@
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+import numpy as np
+from db import conn
+from ladder_history import LADDER_HISTORY_WINDOW
+
+@dataclass
+class RaceNeighbour:
+    character_name: str
+    rank: int
+    experience: int
+    # fitted xp per hour over the history window
+    xph: float
+    # hours until we overtake (if ahead of us) or get overtaken (if behind), None if it does not happen at the current rates
+    crossing_hours: Optional[float]
+
+@dataclass
+class RankRace:
+    fetch_ts: datetime
+    rank: int
+    experience: int
+    xph: float
+    neighbours: list[RaceNeighbour]
+    # columns of the neighbours' projection, see rank_at
+    _experience: np.ndarray
+    _xph: np.ndarray
+
+    def rank_at(self, hours) -> np.ndarray:
+        """
+        projected rank after hours (scalar or array) since the fetch, counting only the tracked neighbours as movers
+        """
+        hours = np.asarray(hours, dtype=np.float64)
+        above = min([n.rank for n in self.neighbours if n.rank < self.rank], default=self.rank)
+        own = self.experience + self.xph * hours
+        theirs = self._experience + self._xph * hours[..., None]
+        return above + (theirs > own[..., None]).sum(axis=-1)
+
+    def next_crossing(self) -> Optional[RaceNeighbour]:
+        crossings = [n for n in self.neighbours if n.crossing_hours is not None]
+        return min(crossings, key=lambda n: n.crossing_hours, default=None)
+
+def fit_rates(character_ix: np.ndarray, hours: np.ndarray, experience: np.ndarray, n: int) -> np.ndarray:
+    """
+    least squares slope of experience over hours per character, all characters at once
+
+    :param character_ix: Array of character indices in [0, n) per point.
+    :return: Array of n slopes, 0 for characters with fewer than two distinct times.
+    """
+    counts = np.bincount(character_ix, minlength=n)
+    safe_counts = np.maximum(counts, 1)
+    mean_t = np.bincount(character_ix, hours, n) / safe_counts
+    mean_x = np.bincount(character_ix, experience, n) / safe_counts
+    dt = hours - mean_t[character_ix]
+    dx = experience - mean_x[character_ix]
+    var = np.bincount(character_ix, dt * dt, n)
+    cov = np.bincount(character_ix, dt * dx, n)
+    return np.divide(cov, var, out=np.zeros(n), where=var > 0)
+
+def crossing_times(gap: np.ndarray, relative_xph: np.ndarray) -> np.ndarray:
+    """
+    :param gap: Array of their experience minus ours.
+    :param relative_xph: Array of our xph minus theirs.
+    :return: Array of hours until the gap closes, NaN if it never does.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        hours = gap / relative_xph
+    return np.where(np.isfinite(hours) & (hours > 0), hours, np.nan)
+
+class RankRaceProjector:
+    """
+    Projects the race against the neighbours ranked around a character, from their recorded ladder history
+    (see ladder_history). projections are computed once per ladder fetch and cached
+    """
+
+    def __init__(self, neighbours: int = LADDER_HISTORY_WINDOW, window: timedelta = timedelta(hours=6)):
+        self.neighbours = neighbours
+        self.window = window
+        self._lock = threading.Lock()
+        self._latest: Optional[RankRace] = None
+
+    def latest(self) -> Optional[RankRace]:
+        return self._latest
+
+    def update(self, league: str, character_name: str, own_xph: float = None, own_experience: int = None) -> Optional[RankRace]:
+        """
+        :param own_xph: our xp per hour, fitted from the ladder history if None
+        :param own_experience: our current experience if more recent than the ladder
+        """
+        with self._lock:
+            self._latest = race = self._project(league, character_name, own_xph, own_experience)
+            return race
+
+    def _project(self, league, character_name, own_xph, own_experience) -> Optional[RankRace]:
+        cursor = conn.cursor()
+        try:
+            fetch_ts = cursor.execute("SELECT max(fetch_ts) FROM ladder_fetches WHERE league = ?", [league]).fetchone()[0]
+            own = cursor.execute("SELECT character_id, rank FROM ladder_latest WHERE league = ? AND character_name = ?", [league, character_name]).fetchone()
+            if fetch_ts is None or own is None:
+                return None
+            own_id, own_rank = own
+            latest = cursor.execute("""
+                SELECT character_id, character_name, rank, experience FROM ladder_latest
+                WHERE league = $league AND rank BETWEEN $rank - $n AND $rank + $n
+                ORDER BY rank
+            """, {"league": league, "rank": own_rank, "n": self.neighbours}).fetchall()
+            since = fetch_ts - self.window
+            # the state at the start of the window and every change within it, per character
+            points = cursor.execute("""
+                WITH h AS (
+                    SELECT character_id, fetch_ts, experience FROM ladder_history
+                    WHERE league = $league AND character_id IN (SELECT unnest($ids)) AND rank IS NOT NULL
+                )
+                SELECT character_id, greatest(max(fetch_ts), $since), arg_max(experience, fetch_ts) FROM h WHERE fetch_ts <= $since GROUP BY character_id
+                UNION ALL
+                SELECT character_id, fetch_ts, experience FROM h WHERE fetch_ts > $since
+            """, {"league": league, "ids": [row[0] for row in latest], "since": since}).fetchall()
+        finally:
+            cursor.close()
+
+        ids = [row[0] for row in latest]
+        index = {character_id: i for i, character_id in enumerate(ids)}
+        experience_now = np.array([row[3] for row in latest], dtype=np.float64)
+        # entries only change when recorded, every character is unchanged from its last change up to the fetch
+        character_ix = np.concatenate([np.array([index[p[0]] for p in points], dtype=np.int64), np.arange(len(ids))])
+        hours = np.concatenate([np.array([(p[1] - since).total_seconds() / 3600 for p in points]), np.full(len(ids), self.window.total_seconds() / 3600)])
+        point_experience = np.concatenate([np.array([p[2] for p in points], dtype=np.float64), experience_now])
+        rates = fit_rates(character_ix, hours, point_experience, len(ids))
+
+        own_ix = index[own_id]
+        if own_xph is None:
+            own_xph = float(rates[own_ix])
+        if own_experience is None:
+            own_experience = int(experience_now[own_ix])
+        others = np.arange(len(ids)) != own_ix
+        crossings = crossing_times(experience_now[others] - own_experience, own_xph - rates[others])
+        neighbours = [
+            RaceNeighbour(row[1], row[2], int(row[3]), float(rate), None if np.isnan(crossing) else float(crossing))
+            for row, rate, crossing in zip((row for row, other in zip(latest, others) if other), rates[others], crossings)
+        ]
+        return RankRace(fetch_ts, own_rank, own_experience, own_xph, neighbours, experience_now[others], rates[others])
+
+rank_race = RankRaceProjector()
@@ -31,7 +31,24 @@ config = config_manager = ConfigManager(path="user_data/config.json", meta={
         "label": "Apply ladder XP snapshot",
         "type": bool,
         "default": False,
-        "description": "If true, will use ladder XP to create XP snapshots (typically inaccurate due to delay)"
+        "description": "If true, will use ladder XP to create XP snapshots, back-dated by the ladder delay measured against OCR readings"
+    },
+    "ladder_api_url": {
+        "label": "Ladder API URL",
+        "type": str,
+        "default": "https://pathofexile2.com/internal-api/content/game-ladder/id/",
+        "description": "Base URL of the ladder API, the league name is appended"
+    },
+    "ladder_watchlist": {
+        "label": "Ladder watchlist",
+        "type": str,
+        "description": "Comma separated character names (or account names with #discriminator) to show ranks of"
+    },
+    "record_ladder_history": {
+        "label": "Record ladder history",
+        "type": bool,
+        "default": True,
+        "description": "Stores the ladder changes around your character and watchlist, used for rival XP/h, rank trajectories and the rank race"
     },
     "twitch_name": {
         "label": "Twitch name",
@@ -64,5 +81,29 @@ config = config_manager = ConfigManager(path="user_data/config.json", meta={
         "label": "Add unknown encounters as screenshot",
         "type": bool,
         "default": True
+    },
+    "compact_xp_snapshots": {
+        "label": "Compact XP snapshots",
+        "type": bool,
+        "default": True,
+        "description": "Periodically thins old XP snapshots to map boundaries and hourly points while in hideout"
+    },
+    "idle_stats_window": {
+        "label": "Idle statistics window (maps)",
+        "type": int,
+        "default": 1000,
+        "description": "Number of most recent maps the idle medians are computed over"
+    },
+    "xp_snapshot_full_resolution_days": {
+        "label": "XP snapshot full resolution (days)",
+        "type": int,
+        "default": 14,
+        "description": "XP snapshots younger than this are never compacted"
+    },
+    "eta_target_level": {
+        "label": "ETA target level",
+        "type": int,
+        "default": 100,
+        "description": "Level to estimate the ETA for in addition to the next level"
     }
 })
\ No newline at end of file
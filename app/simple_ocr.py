@@ -48,12 +48,15 @@ def text_template(text, font, color=(255, 255, 255), mode="RGB"):
     template = np.array(image)
     return cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
 
-def load_font_q(font_size=25.5, font_path=FONT_PATH):
+@lru_cache(maxsize=8)
+def load_font_family_q(font_path=FONT_PATH):
     font_id = QFontDatabase.addApplicationFont(font_path)
     if font_id < 0:
         raise RuntimeError(f"Failed to load font from {font_path}")
-    font_family = QFontDatabase.applicationFontFamilies(font_id)[0]
-    font = QFont(font_family, font_size)
+    return QFontDatabase.applicationFontFamilies(font_id)[0]
+
+def load_font_q(font_size=25.5, font_path=FONT_PATH):
+    font = QFont(load_font_family_q(font_path), font_size)
     return font
 
 @lru_cache(maxsize=128)
@@ -0,0 +1,61 @@
+import json
+import threading
+from datetime import datetime
+from typing import Any, Iterable
+from db import conn
+
+class StateStore:
+    """
+    Versioned key-value store on top of the kv_state table. every key holds a single row that is upserted,
+    writes of several keys via put_many are applied atomically
+    """
+
+    def __init__(self, conn):
+        self._cursor = conn.cursor()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._cursor.execute("SELECT data FROM kv_state WHERE key = ?", [key]).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else default
+
+    def get_many(self, keys: Iterable[str]) -> dict[str, Any]:
+        keys = list(keys)
+        with self._lock:
+            rows = self._cursor.execute("SELECT key, data FROM kv_state WHERE key IN (SELECT unnest(?))", [keys]).fetchall()
+        values = dict.fromkeys(keys)
+        values.update((key, json.loads(data) if data is not None else None) for key, data in rows)
+        return values
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        returns all keys as of a single read
+        """
+        with self._lock:
+            rows = self._cursor.execute("SELECT key, data FROM kv_state").fetchall()
+        return {key: json.loads(data) if data is not None else None for key, data in rows}
+
+    def version(self, key: str) -> int:
+        with self._lock:
+            row = self._cursor.execute("SELECT version FROM kv_state WHERE key = ?", [key]).fetchone()
+        return row[0] if row else 0
+
+    def put(self, key: str, value: Any):
+        self.put_many({key: value})
+
+    def put_many(self, values: dict[str, Any]):
+        now = datetime.now()
+        with self._lock:
+            self._cursor.execute("BEGIN TRANSACTION")
+            try:
+                for key, value in values.items():
+                    self._cursor.execute("""
+                        INSERT INTO kv_state (key, version, updated_at, data) VALUES (?, 1, ?, ?)
+                        ON CONFLICT (key) DO UPDATE SET version = version + 1, updated_at = EXCLUDED.updated_at, data = EXCLUDED.data
+                    """, [key, now, json.dumps(value) if value is not None else None])
+                self._cursor.execute("COMMIT")
+            except Exception:
+                self._cursor.execute("ROLLBACK")
+                raise
+
+state_store = StateStore(conn)
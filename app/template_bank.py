@@ -0,0 +1,94 @@
+import hashlib
+import os
+import threading
+from dataclasses import dataclass
+from typing import Iterable
+import numpy as np
+import simple_ocr
+from PySide6.QtGui import QFont
+
+TEMPLATE_BANK_PATH = "user_data/template_bank.npz"
+# bump when rendering changes, invalidates cached banks
+TEMPLATE_BANK_VERSION = 1
+
+@dataclass(frozen=True)
+class TextTemplateSpec:
+    text: str
+    font_size: float
+    color: tuple[int, int, int]
+    weight: int = 100
+
+    def key(self) -> str:
+        return f"{self.text}|{self.font_size:g}|{','.join(map(str, self.color))}|{self.weight}"
+
+def render_template(spec: TextTemplateSpec, font_path: str = simple_ocr.FONT_PATH) -> np.ndarray:
+    font = simple_ocr.load_font_q(spec.font_size, font_path)
+    font.setWeight(QFont.Weight(spec.weight))
+    return simple_ocr.text_template_q(spec.text, font=font, color=spec.color)
+
+def font_hash(font_path: str) -> str:
+    with open(font_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+class TemplateBank:
+    """
+    Grayscale text templates rendered once per spec and cached in an npz file, which is re-rendered when the font file
+    or TEMPLATE_BANK_VERSION change. templates of specs not known in advance are rendered on first use
+    """
+
+    def __init__(self, specs: Iterable[TextTemplateSpec], font_path: str = simple_ocr.FONT_PATH, path: str = TEMPLATE_BANK_PATH):
+        self.specs = list(specs)
+        self.font_path = font_path
+        self.path = path
+        self._templates: dict[TextTemplateSpec, np.ndarray] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def load(self):
+        """
+        loads the cached templates, rendering and saving any that are missing. rendering needs a QGuiApplication
+        """
+        with self._lock:
+            if self._loaded:
+                return
+            digest = f"{font_hash(self.font_path)}-{TEMPLATE_BANK_VERSION}"
+            cached = self._read(digest)
+            missing = [spec for spec in self.specs if spec.key() not in cached]
+            for spec in self.specs:
+                self._templates[spec] = cached[spec.key()] if spec.key() in cached else render_template(spec, self.font_path)
+            if missing:
+                self._write(digest)
+                print(f"[Info] rendered {len(missing)} text templates to {self.path}")
+            self._loaded = True
+
+    def get(self, text: str, font_size: float, color: tuple[int, int, int], weight: int = 100) -> np.ndarray:
+        spec = TextTemplateSpec(text, font_size, tuple(color), weight)
+        template = self._templates.get(spec)
+        if template is None:
+            self.load()
+            template = self._templates.get(spec)
+        if template is None:
+            print(f"[Info] text template {spec.key()} is not in the template bank, rendering it")
+            template = self._templates[spec] = render_template(spec, self.font_path)
+        return template
+
+    def _read(self, digest: str) -> dict[str, np.ndarray]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if str(data["font_hash"]) != digest:
+                    print("[Info] font or template rendering changed, re-rendering text templates")
+                    return {}
+                return {str(key): data[f"t{i}"] for i, key in enumerate(data["keys"])}
+        except Exception as e:
+            print(f"[Error] failed to read template bank {self.path}: {e}")
+            return {}
+
+    def _write(self, digest: str):
+        specs = list(self._templates)
+        arrays = {f"t{i}": self._templates[spec] for i, spec in enumerate(specs)}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp.npz"
+        np.savez(tmp_path, font_hash=np.array(digest), keys=np.array([spec.key() for spec in specs]), **arrays)
+        os.replace(tmp_path, self.path)
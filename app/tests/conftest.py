@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# app modules import their siblings by name and db opens user_data/poe_tracker.duckdb at import, run them in a scratch dir
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_tmp = tempfile.mkdtemp(prefix="poe_tracker_tests_")
+os.makedirs(os.path.join(_tmp, "user_data"))
+os.chdir(_tmp)
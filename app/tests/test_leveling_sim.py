@@ -0,0 +1,26 @@
+import time
+import numpy as np
+import pytest
+from xp_table import experience_table
+
+# leveling_sim imports poe_bridge, which needs the desktop dependencies
+leveling_sim = pytest.importorskip("leveling_sim")
+
+def _history(base_xp, area_level, seconds=300.0, n=100):
+    return leveling_sim.MapHistory(np.full(n, base_xp, dtype=np.float64), np.full(n, area_level), np.full(n, seconds))
+
+def test_simulate_reaches_target():
+    sim = leveling_sim.LevelingSimulator(seed=0)
+    sim._history = _history(5e6, 70)
+    eta = sim.simulate(experience_table[59], [65])
+    assert eta[65].reached == 1.0
+    assert all(hours is not None and hours > 0 for hours in eta[65].hours.values())
+
+def test_simulate_unreachable_target_is_bounded():
+    sim = leveling_sim.LevelingSimulator(seed=0)
+    # an endgame character in low maps, level 100 is thousands of hours away
+    sim._history = _history(2e6, 81)
+    start = time.perf_counter()
+    eta = sim.simulate(experience_table[93] + 1000, [100])
+    assert time.perf_counter() - start < 1
+    assert eta[100].hours == {10: None, 50: None, 90: None}
@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+import pytest
+from db import conn
+from xp_compaction import CompactionPolicy, compact_xp_snapshots
+
+NOW = datetime(2026, 3, 1)
+
+@pytest.fixture
+def snapshots():
+    conn.execute("DELETE FROM xp_snapshots")
+    conn.execute("DELETE FROM xp_segments")
+    conn.execute("DELETE FROM maps")
+    # 2000 snapshots over 30 days in +100 xp steps, with the segments between them
+    conn.execute("""
+        CREATE OR REPLACE TEMP TABLE _test_snapshots AS
+        SELECT i, $start + i * INTERVAL 1296 SECOND AS ts FROM range(2000) t(i)
+    """, {"start": NOW - timedelta(days=30)})
+    conn.execute("""
+        INSERT INTO xp_snapshots (id, data)
+        SELECT CAST(i AS VARCHAR), json_object('ts', strftime(ts, '%Y-%m-%dT%H:%M:%S'), 'xp', 1000 + 100 * i, 'delta', CASE WHEN i > 0 THEN 100 ELSE 0 END, 'source', 'ocr')
+        FROM _test_snapshots
+    """)
+    conn.execute("""
+        INSERT INTO xp_segments (id, map_id, data)
+        SELECT CAST(i - 1 AS VARCHAR), NULL, json_object(
+            'start_ts', strftime(ts - INTERVAL 1296 SECOND, '%Y-%m-%dT%H:%M:%S'), 'end_ts', strftime(ts, '%Y-%m-%dT%H:%M:%S'),
+            'xp', 100, 'encounter_type', NULL, 'source', 'ocr', 'map_id', NULL
+        )
+        FROM _test_snapshots WHERE i > 0
+    """)
+
+def total(query):
+    return conn.execute(query).fetchone()[0]
+
+def test_compaction_keeps_delta_sum(snapshots):
+    delta_sum = total("SELECT sum(CAST(data->>'delta' AS BIGINT)) FROM xp_snapshots")
+    removed = compact_xp_snapshots(CompactionPolicy(), NOW)
+    assert removed > 0
+    assert total("SELECT sum(CAST(data->>'delta' AS BIGINT)) FROM xp_snapshots") == delta_sum
+
+def test_compaction_deltas_match_xp_of_retained_predecessor(snapshots):
+    compact_xp_snapshots(CompactionPolicy(), NOW)
+    rows = conn.execute("""
+        SELECT CAST(data->>'xp' AS BIGINT), CAST(data->>'delta' AS BIGINT) FROM xp_snapshots ORDER BY CAST(data->>'ts' AS TIMESTAMP)
+    """).fetchall()
+    for (prev_xp, _), (xp, delta) in zip(rows, rows[1:]):
+        assert delta == xp - prev_xp
+
+def test_compaction_merges_old_segments(snapshots):
+    xp_sum = total("SELECT sum(CAST(data->>'xp' AS BIGINT)) FROM xp_segments")
+    segments = total("SELECT count(*) FROM xp_segments")
+    compact_xp_snapshots(CompactionPolicy(), NOW)
+    assert total("SELECT count(*) FROM xp_segments") < segments
+    assert total("SELECT sum(CAST(data->>'xp' AS BIGINT)) FROM xp_segments") == xp_sum
+    # merged segments still cover the same time without overlaps
+    rows = conn.execute("""
+        SELECT CAST(data->>'start_ts' AS TIMESTAMP), CAST(data->>'end_ts' AS TIMESTAMP) FROM xp_segments ORDER BY 1
+    """).fetchall()
+    for (_, prev_end), (start, _) in zip(rows, rows[1:]):
+        assert prev_end == start
@@ -0,0 +1,23 @@
+import pytest
+from xp_table import experience_table, split_xp_range, unapply_xp_penalty, unapply_xp_penalties
+
+def test_split_xp_range_splits_at_level_boundaries():
+    assert split_xp_range((500, 2000)) == [(500, 525), (525, 1760), (1760, 2000)]
+    assert split_xp_range((600, 600)) == []
+
+def test_split_xp_range_keeps_reversed_ranges_whole():
+    assert split_xp_range((2000, 500)) == [(2000, 500)]
+    assert split_xp_range((experience_table[-1], 500)) == []
+
+def test_split_xp_range_rejects_negative_xp():
+    with pytest.raises(ValueError):
+        split_xp_range((-1, 500))
+
+def test_unapply_xp_penalty_keeps_xp_lost_within_a_level():
+    lo = experience_table[89]
+    lost = unapply_xp_penalty((lo + 5000, lo + 10), 80)
+    assert lost == [-54907]
+    assert unapply_xp_penalties([lo + 5000], [lo + 10], [80]).tolist() == lost
+    # xp is never lost across a level boundary
+    assert unapply_xp_penalty((lo + 5000, lo - 10), 80) == []
+    assert unapply_xp_penalties([lo + 5000], [lo - 10], [80]).tolist() == [0]
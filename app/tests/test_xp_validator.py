@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta
+from instance_tracker import XPSnapshot
+from xp_table import get_xp_range_for_level
+from xp_validator import XPReadingValidator, previous_snapshot
+
+TS = datetime(2026, 3, 1)
+
+def reading(level, fraction=0.5):
+    lo, hi = get_xp_range_for_level(level)
+    return lo + int((hi - lo) * fraction), hi
+
+def test_rejects_drop_below_level():
+    previous = XPSnapshot("a", TS, reading(90)[0], 0)
+    validator = XPReadingValidator(previous, TS + timedelta(minutes=1))
+    assert validator.check(*reading(60)) is not None
+
+def test_accepts_discontinuity_when_passes_agree():
+    previous = XPSnapshot("a", TS, reading(90)[0], 0)
+    validator = XPReadingValidator(previous, TS + timedelta(minutes=1))
+    assert validator.check(*reading(60)) is not None
+    assert validator.check(*reading(60)) is None
+
+def test_accepts_discontinuity_confirmed_by_next_capture():
+    previous = XPSnapshot("a", TS, reading(90)[0], 0)
+    first = XPReadingValidator(previous, TS + timedelta(minutes=1))
+    assert first.check(*reading(60)) is not None
+    unconfirmed = first.next_unconfirmed()
+    assert unconfirmed.xp == reading(60)[0]
+    second = XPReadingValidator(previous, TS + timedelta(minutes=2), unconfirmed=unconfirmed)
+    assert second.check(*reading(60, 0.51)) is None
+
+def test_deferred_reading_is_checked_against_the_snapshot_before_it():
+    snapshots = [XPSnapshot("a", TS, 1000, 0), XPSnapshot("b", TS + timedelta(minutes=10), 5000, 4000)]
+    assert previous_snapshot(snapshots, TS + timedelta(minutes=5)).id == "a"
+    assert previous_snapshot(snapshots).id == "b"
+    assert previous_snapshot(snapshots, TS - timedelta(minutes=1)) is None
@@ -0,0 +1,44 @@
+import os
+import pickle
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+from item import Item
+from instance_tracker import MapInstance
+
+# bump whenever a pickled dataclass changes shape, older snapshots are then ignored
+WARM_START_VERSION = 2
+
+@dataclass
+class WarmStartState:
+    version: int
+    written_at: datetime
+    log_file: str
+    log_offset: int
+    # (maps, xp_snapshots, xp_segments, encounters) row counts, used to detect writes the snapshot doesn't know about
+    row_counts: tuple[int, ...]
+    recent_maps: list
+    recent_xp_snapshots: list
+    recent_xp_segments: list
+    recent_encounters: list
+    current_map: Optional[MapInstance]
+    next_waystone: Optional[Item]
+
+def save_warm_start(path: str, state: WarmStartState):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+def load_warm_start(path: str) -> Optional[WarmStartState]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+    except Exception as e:
+        print(f"[Warn] unable to read warm start snapshot: {e}")
+        return None
+    if not isinstance(state, WarmStartState) or state.version != WARM_START_VERSION:
+        return None
+    return state
@@ -0,0 +1,200 @@
+import re
+import json
+import threading
+from dataclasses import dataclass
+from typing import Optional
+import numpy as np
+import scipy.linalg
+import scipy.sparse
+from db import conn
+from item import Item, Mod
+from area_tla import get_threat_indicator
+from instance_tracker import MapInstance
+from poe_bridge import events
+
+NUMBER_PATTERN = re.compile(r"[+-]?\d+(?:\.\d+)?")
+# unpenalized covariates preceding the mod columns
+BASE_FEATURES = ("intercept", "area_level")
+
+def normalize_mod(text: str) -> tuple[str, float]:
+    """
+    Splits a mod text into a stat key with numbers replaced by # and its magnitude (mean of the numbers, 1 if there are none),
+    e.g. "Monsters deal 25% of Damage as Extra Fire" -> ("monsters deal #% of damage as extra fire", 25.0)
+    """
+    numbers = [abs(float(n)) for n in NUMBER_PATTERN.findall(text)]
+    key = " ".join(NUMBER_PATTERN.sub("#", text).lower().split())
+    return key, sum(numbers) / len(numbers) if numbers else 1.0
+
+def waystone_mods(waystone: Item) -> list[tuple[str, float, Optional[Mod]]]:
+    # implicits aggregate the affixes (quantity, rarity, pack size), only explicit mods and corruption enchants are used
+    mods = [(*normalize_mod(mod.text), mod) for mod in waystone.affixes + waystone.enchants]
+    if waystone.corrupted:
+        mods.append(("corrupted", 1.0, None))
+    return mods
+
+@dataclass
+class ModImpact:
+    key: str
+    maps: int
+    # magnitude the coefficients refer to, the upper bound of the threat table range or the first seen magnitude
+    reference: float
+    xph: float
+    map_time: float
+    threat: Optional[float]
+
+class WaystoneModModel:
+    """
+    Ridge regression of map xph and map time (seconds) against waystone mods. each mod key is a column of the sparse
+    design matrix holding the mod's magnitude relative to the key's reference magnitude, area level and an intercept
+    are unpenalized covariates. the normal equations are accumulated per map, so maps are added and removed
+    incrementally and a refit only solves a system of the size of the number of distinct mod keys
+    """
+
+    def __init__(self, alpha: float = 1.0):
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self._columns: dict[str, int] = {name: i for i, name in enumerate(BASE_FEATURES)}
+        self._references: dict[str, float] = {}
+        self._threats: dict[str, Optional[float]] = {}
+        self._counts = np.zeros(len(BASE_FEATURES), dtype=np.int64)
+        self._xtx = np.zeros((len(BASE_FEATURES), len(BASE_FEATURES)))
+        self._xty = np.zeros((len(BASE_FEATURES), 2))
+        self._map_ids = set()
+        self._loaded = False
+        self._impacts: Optional[list[ModImpact]] = None
+
+    def __len__(self):
+        return len(self._map_ids)
+
+    def load(self, batch_size: int = 5000):
+        """
+        adds all maps with a waystone that are not part of the model yet
+        """
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT id, data->'waystone', CAST(data->>'area_level' AS INTEGER), CAST(data->>'xph' AS DOUBLE), data->'span'->>'end', CAST(data->'span'->>'map_time' AS DOUBLE)
+                FROM maps
+                WHERE data->>'waystone' IS NOT NULL AND id NOT IN (SELECT unnest($map_ids))
+            """, {"map_ids": list(self._map_ids)})
+            while rows := cursor.fetchmany(batch_size):
+                rows = [
+                    (id, Item.from_dict(json.loads(waystone)), area_level, xph, map_time)
+                    for id, waystone, area_level, xph, end, map_time in rows if self._is_usable(waystone, area_level, xph, end, map_time)
+                ]
+                with self._lock:
+                    self._add_rows(rows)
+        finally:
+            cursor.close()
+        self._loaded = True
+
+    def refresh(self):
+        """
+        adds maps inserted without a map_completed event (log imports), once the model is loaded
+        """
+        if self._loaded:
+            self.load()
+
+    def add(self, map: MapInstance):
+        map_time = map.span.map_time()
+        map_time = map_time.total_seconds() if map_time else None
+        if not self._loaded or not self._is_usable(map.waystone, map.area_level, map.xph, map.span.end, map_time):
+            return
+        with self._lock:
+            self._add_rows([(map.id, map.waystone, map.area_level, map.xph, map_time)])
+
+    def remove(self, map: MapInstance):
+        if map.id not in self._map_ids:
+            return
+        with self._lock:
+            self._add_rows([(map.id, map.waystone, map.area_level, map.xph, map.span.map_time().total_seconds())], sign=-1)
+
+    def impacts(self) -> list[ModImpact]:
+        """
+        :return: mod impacts ordered by xph impact, descending
+        """
+        if not self._loaded:
+            self.load()
+        with self._lock:
+            if self._impacts is None:
+                self._impacts = self._fit()
+            return self._impacts
+
+    @staticmethod
+    def _is_usable(waystone, area_level, xph, end, map_time) -> bool:
+        """
+        whether a map is part of the model, shared by add and load so that a rebuilt model matches the live one
+        """
+        return waystone is not None and area_level is not None and bool(xph) and xph > 0 and end is not None and bool(map_time) and map_time > 0
+
+    def _column(self, key: str, magnitude: float, mod: Optional[Mod]) -> int:
+        column = self._columns.get(key)
+        if column is None:
+            self._columns[key] = column = len(self._columns)
+            ti = get_threat_indicator(mod) if mod else None
+            self._references[key] = float(ti.magnitude_range[1]) if ti and ti.magnitude_range[1] else magnitude or 1.0
+            self._threats[key] = ti.multi if ti else None
+        return column
+
+    def _add_rows(self, rows, sign: int = 1):
+        data, indices, indptr = [], [], [0]
+        y = []
+        for map_id, waystone, area_level, xph, map_time in rows:
+            if sign > 0:
+                if map_id in self._map_ids:
+                    continue
+                self._map_ids.add(map_id)
+            else:
+                self._map_ids.discard(map_id)
+            features = {0: 1.0, 1: float(area_level)}
+            for key, magnitude, mod in waystone_mods(waystone):
+                column = self._column(key, magnitude, mod)
+                features[column] = features.get(column, 0.0) + magnitude / self._references[key]
+            indices.extend(features.keys())
+            data.extend(features.values())
+            indptr.append(len(indices))
+            y.append((xph, map_time))
+        if not y:
+            return
+
+        n_features = len(self._columns)
+        X = scipy.sparse.csr_matrix((data, indices, indptr), shape=(len(y), n_features))
+        if n_features > len(self._xtx):
+            grow = n_features - len(self._xtx)
+            self._xtx = np.pad(self._xtx, ((0, grow), (0, grow)))
+            self._xty = np.pad(self._xty, ((0, grow), (0, 0)))
+            self._counts = np.pad(self._counts, (0, grow))
+        self._xtx += sign * (X.T @ X).toarray()
+        self._xty += sign * (X.T @ np.array(y, dtype=np.float64))
+        self._counts += sign * X.getnnz(axis=0)
+        self._impacts = None
+
+    def _fit(self) -> list[ModImpact]:
+        n_features = len(self._columns)
+        if not self._map_ids or n_features <= len(BASE_FEATURES):
+            return []
+        penalty = np.full(n_features, self.alpha)
+        penalty[:len(BASE_FEATURES)] = 0
+        # least squares rather than solve, the covariates are collinear if all maps share the same area level
+        coef = scipy.linalg.lstsq(self._xtx + np.diag(penalty), self._xty)[0]
+        impacts = []
+        for key, column in self._columns.items():
+            if column < len(BASE_FEATURES) or self._counts[column] <= 0:
+                continue
+            impacts.append(ModImpact(key, int(self._counts[column]), self._references[key], float(coef[column, 0]), float(coef[column, 1]), self._threats[key]))
+        impacts.sort(key=lambda impact: impact.xph, reverse=True)
+        return impacts
+
+waystone_model = WaystoneModModel()
+
+events.on("map_completed", lambda event: waystone_model.add(event["map"]))
+events.on("map_deleted", lambda event: waystone_model.remove(event["map"]))
+events.on("maps_imported", lambda _: waystone_model.refresh())
+
+if __name__ == "__main__":
+    for impact in waystone_model.impacts():
+        threat = f", threat {impact.threat}" if impact.threat is not None else ""
+        print(f"{impact.key} (@{impact.reference:g}, {impact.maps} maps): {impact.xph:+,.0f} xp/h, {impact.map_time:+.0f}s map time{threat}")
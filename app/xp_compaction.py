@@ -0,0 +1,157 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from db import conn
+
+@dataclass
+class CompactionPolicy:
+    """
+    snapshots younger than full_resolution are kept as-is, older ones are thinned to the
+    snapshots that bound a map (xp_start / xp_end) plus the last snapshot of every point_interval
+    """
+    full_resolution: timedelta = timedelta(days=14)
+    point_interval: timedelta = timedelta(hours=1)
+
+    def __post_init__(self):
+        if not isinstance(self.full_resolution, timedelta) or self.full_resolution.total_seconds() < 0:
+            raise ValueError("full_resolution must be a non-negative timedelta")
+        if not isinstance(self.point_interval, timedelta) or self.point_interval.total_seconds() <= 0:
+            raise ValueError("point_interval must be a positive timedelta")
+
+    def cutoff(self, now: datetime) -> datetime:
+        # align the cutoff to a bucket boundary, so that the last snapshot before the cutoff is always retained
+        cutoff = now - self.full_resolution
+        interval = int(self.point_interval.total_seconds())
+        epoch_seconds = int((cutoff - datetime(1970, 1, 1)).total_seconds())
+        return datetime(1970, 1, 1) + timedelta(seconds=epoch_seconds - epoch_seconds % interval)
+
+_KEEP_QUERY = """
+    CREATE TEMP TABLE _xp_compaction_keep AS
+    WITH s AS (
+        SELECT id, CAST(data->>'ts' AS TIMESTAMP) AS ts FROM xp_snapshots
+    ), spans AS (
+        SELECT start_ts, end_ts FROM map_spans WHERE end_ts IS NOT NULL
+    )
+    SELECT id FROM s WHERE ts >= $cutoff
+    UNION
+    SELECT arg_max(id, ts) FROM s WHERE ts < $cutoff GROUP BY time_bucket(to_seconds($interval), ts)
+    -- xp_start: last snapshot before entering the map or first snapshot within the grace period
+    UNION
+    SELECT s.id FROM spans ASOF JOIN s ON spans.start_ts >= s.ts
+    UNION
+    SELECT s.id FROM spans ASOF JOIN s ON spans.start_ts <= s.ts
+    -- xp_end: last snapshot before the map was completed
+    UNION
+    SELECT s.id FROM spans ASOF JOIN s ON spans.end_ts >= s.ts
+"""
+
+# every removed snapshot is followed by a retained one within its bucket, which absorbs the deltas of the removed
+# snapshots before it. must run before the delete
+_REBASE_DELTA_QUERY = """
+    UPDATE xp_snapshots SET data = json_merge_patch(xp_snapshots.data, json_object('delta', d.delta))
+    FROM (
+        SELECT id, kept, old_delta, sum(old_delta) OVER (PARTITION BY grp) AS delta
+        FROM (
+            SELECT
+                id,
+                kept,
+                old_delta,
+                -- a retained snapshot and the removed ones right before it share a group
+                count(*) FILTER (WHERE kept) OVER (ORDER BY ts DESC, id DESC ROWS UNBOUNDED PRECEDING) AS grp
+            FROM (
+                SELECT
+                    id,
+                    CAST(data->>'ts' AS TIMESTAMP) AS ts,
+                    COALESCE(CAST(data->>'delta' AS BIGINT), 0) AS old_delta,
+                    id IN (SELECT id FROM _xp_compaction_keep) AS kept
+                FROM xp_snapshots
+                WHERE CAST(data->>'ts' AS TIMESTAMP) < $cutoff
+            )
+        )
+    ) d
+    WHERE xp_snapshots.id = d.id AND d.kept AND d.delta != d.old_delta
+"""
+
+# consecutive segments older than the cutoff with the same map, encounter and source are merged per interval, into the
+# earliest segment of each run. keeps their xp sum and attribution
+_MERGE_SEGMENTS_QUERIES = [
+    """
+    CREATE TEMP TABLE _xp_segment_runs AS
+    SELECT id, end_ts_text, end_ts, xp, sum(opens::INTEGER) OVER (ORDER BY start_ts, id) AS run
+    FROM (
+        SELECT
+            *,
+            (map_id, encounter_type, source, bucket) IS DISTINCT FROM
+                (lag(map_id) OVER w, lag(encounter_type) OVER w, lag(source) OVER w, lag(bucket) OVER w) AS opens
+        FROM (
+            SELECT
+                id,
+                map_id,
+                data->>'encounter_type' AS encounter_type,
+                data->>'source' AS source,
+                data->>'end_ts' AS end_ts_text,
+                CAST(data->>'start_ts' AS TIMESTAMP) AS start_ts,
+                CAST(data->>'end_ts' AS TIMESTAMP) AS end_ts,
+                CAST(data->>'xp' AS BIGINT) AS xp,
+                time_bucket(to_seconds($interval), CAST(data->>'start_ts' AS TIMESTAMP)) AS bucket
+            FROM xp_segments
+            WHERE CAST(data->>'start_ts' AS TIMESTAMP) < $cutoff
+        )
+        WINDOW w AS (ORDER BY start_ts, id)
+    )
+    """,
+    """
+    UPDATE xp_segments SET data = json_merge_patch(xp_segments.data, json_object('end_ts', r.end_ts_text, 'xp', r.xp))
+    FROM (
+        SELECT arg_min(id, end_ts) AS id, arg_max(end_ts_text, end_ts) AS end_ts_text, sum(xp) AS xp, count(*) AS segments
+        FROM _xp_segment_runs GROUP BY run
+    ) r
+    WHERE xp_segments.id = r.id AND r.segments > 1
+    """,
+    """
+    DELETE FROM xp_segments WHERE id IN (
+        SELECT id FROM _xp_segment_runs QUALIFY row_number() OVER (PARTITION BY run ORDER BY end_ts, id) > 1
+    )
+    """,
+    "DROP TABLE _xp_segment_runs",
+]
+
+def compact_xp_snapshots(policy: CompactionPolicy = None, now: datetime = None) -> int:
+    """
+    Thins xp_snapshots older than the policy's full resolution window. retained snapshots absorb the deltas of the
+    removed ones before them, so that the sum of deltas and per-map xp_gained stay consistent. old xp_segments are
+    merged the same way, per map, encounter type and source.
+
+    :return: the number of removed snapshots
+    """
+    if policy is None:
+        policy = CompactionPolicy()
+    if now is None:
+        now = datetime.now()
+
+    params = {"cutoff": policy.cutoff(now), "interval": int(policy.point_interval.total_seconds())}
+    # compaction runs in the background, use a dedicated cursor rather than the shared connection
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN TRANSACTION")
+        try:
+            cursor.execute("DROP TABLE IF EXISTS _xp_compaction_keep")
+            cursor.execute(_KEEP_QUERY, params)
+            cursor.execute(_REBASE_DELTA_QUERY, {"cutoff": params["cutoff"]})
+            removed = cursor.execute("""
+                DELETE FROM xp_snapshots
+                WHERE CAST(data->>'ts' AS TIMESTAMP) < $cutoff AND id NOT IN (SELECT id FROM _xp_compaction_keep)
+            """, {"cutoff": params["cutoff"]}).fetchone()[0]
+            cursor.execute("DROP TABLE _xp_compaction_keep")
+            cursor.execute("DROP TABLE IF EXISTS _xp_segment_runs")
+            for query in _MERGE_SEGMENTS_QUERIES:
+                cursor.execute(query, {name: value for name, value in params.items() if f"${name}" in query})
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+    finally:
+        cursor.close()
+    return removed
+
+if __name__ == "__main__":
+    print(f"removed {compact_xp_snapshots()} xp snapshots")
@@ -0,0 +1,169 @@
+import bisect
+import threading
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+import numpy as np
+
+# the ladder is assumed to publish xp at most this late, longer apparent delays are mismatches (e.g. deaths)
+MAX_LADDER_DELAY = timedelta(minutes=30)
+# ocr readings further apart than this do not pin down when an xp value was reached
+MAX_BRACKET = timedelta(minutes=5)
+MIN_DELAY_SAMPLES = 3
+# back-dated ladder readings may be moved by up to this many delay uncertainties to fit between ocr readings
+MAX_SHIFT = 2.0
+
+@dataclass
+class FusedPoint:
+    ts: datetime
+    xp: int
+    source: str
+    # standard uncertainty of ts, 0 for ocr readings
+    ts_uncertainty: timedelta
+    # standard uncertainty of the xp at ts, ts_uncertainty times the local xp rate
+    xp_uncertainty: float = 0.0
+
+@dataclass
+class LadderDelay:
+    delay: timedelta
+    uncertainty: timedelta
+    samples: int
+
+class XPFusion:
+    """
+    Merges ocr and ladder xp readings into one timeline. the ladder publishes xp late, its delay is measured from ladder
+    readings whose xp was reached between two close ocr readings, and ladder readings are back-dated by it. the timeline
+    never decreases, except for deaths read by ocr
+    """
+
+    def __init__(self, max_readings: int = 500, max_samples: int = 50):
+        self._lock = threading.Lock()
+        self._ocr_ts = []
+        self._ocr_xp = []
+        self.max_readings = max_readings
+        # accepted ladder readings, back-dated
+        self._ladder = deque(maxlen=max_readings)
+        # ladder readings (observed_ts, xp) not yet reached by ocr
+        self._unmatched = deque(maxlen=20)
+        # delay samples, (midpoint, half width) in seconds
+        self._samples = deque(maxlen=max_samples)
+        self._last_ladder_xp = None
+
+    def add_ocr(self, xp: int, ts: datetime):
+        with self._lock:
+            i = bisect.bisect(self._ocr_ts, ts)
+            self._ocr_ts.insert(i, ts)
+            self._ocr_xp.insert(i, xp)
+            if len(self._ocr_ts) > self.max_readings:
+                del self._ocr_ts[0], self._ocr_xp[0]
+            for reading in list(self._unmatched):
+                if self._measure(*reading):
+                    self._unmatched.remove(reading)
+
+    def add_ladder(self, xp: int, observed_ts: datetime) -> Optional[FusedPoint]:
+        """
+        :param observed_ts: when the ladder was fetched
+        :return: the back-dated reading, None if the ladder xp is unchanged or contradicts the ocr readings
+        """
+        with self._lock:
+            # an unchanged entry carries no new information, and its observation time no longer bounds the delay
+            if xp == self._last_ladder_xp:
+                return None
+            self._last_ladder_xp = xp
+            if not self._measure(observed_ts, xp):
+                self._unmatched.append((observed_ts, xp))
+            delay = self._delay()
+            if delay is None:
+                delay = LadderDelay(timedelta(0), MAX_LADDER_DELAY / 2, 0)
+            ts = self._fit(observed_ts - delay.delay, xp, delay.uncertainty * MAX_SHIFT)
+            if ts is None:
+                print(f"[Info] skipping ladder xp {xp}, it does not fit the ocr readings")
+                return None
+            point = FusedPoint(ts, xp, "ladder", delay.uncertainty)
+            self._ladder.append(point)
+            return point
+
+    def delay(self) -> Optional[LadderDelay]:
+        """
+        :return: the estimated ladder delay, None until MIN_DELAY_SAMPLES were measured
+        """
+        with self._lock:
+            return self._delay()
+
+    def timeline(self, since: datetime = None) -> list[FusedPoint]:
+        """
+        :return: ocr and ladder readings since since ordered by time, without ladder readings that contradict the ocr ones
+        """
+        with self._lock:
+            points = [FusedPoint(ts, xp, "ocr", timedelta(0)) for ts, xp in zip(self._ocr_ts, self._ocr_xp)]
+            points += [FusedPoint(p.ts, p.xp, p.source, p.ts_uncertainty) for p in self._ladder if self._fit(p.ts, p.xp, timedelta(0))]
+        # ladder readings moved onto an ocr reading with more xp go before it
+        points.sort(key=lambda p: (p.ts, p.xp))
+        if since is not None:
+            points = [p for p in points if p.ts >= since]
+        if len(points) < 3:
+            return points
+        seconds = np.array([(p.ts - points[0].ts).total_seconds() for p in points])
+        xp = np.array([p.xp for p in points], dtype=np.float64)
+        # local rate over the neighbouring readings
+        span = np.maximum(seconds[2:] - seconds[:-2], 1)
+        rates = np.concatenate([[0], (xp[2:] - xp[:-2]) / span, [0]])
+        for point, rate in zip(points, rates):
+            point.xp_uncertainty = abs(rate) * point.ts_uncertainty.total_seconds()
+        return points
+
+    def _measure(self, observed_ts: datetime, xp: int) -> bool:
+        """
+        adds a delay sample if ocr readings bracket when xp was reached before observed_ts
+
+        :return: False if ocr has not reached xp yet, so the reading should be measured again later
+        """
+        i = bisect.bisect_left(self._ocr_ts, observed_ts - MAX_LADDER_DELAY - MAX_BRACKET)
+        lo = i
+        while i < len(self._ocr_xp) and self._ocr_xp[i] < xp:
+            i += 1
+        if i == len(self._ocr_xp):
+            # ocr did not reach xp yet, unless it read less xp after the fetch already
+            return bool(self._ocr_ts) and self._ocr_ts[-1] >= observed_ts
+        if i == lo or self._ocr_ts[i - 1] >= observed_ts:
+            return True
+        # xp was reached after the previous reading and before both the next reading and the fetch
+        before = self._ocr_ts[i - 1]
+        after = min(self._ocr_ts[i], observed_ts)
+        if after - before <= MAX_BRACKET:
+            delay_lo = (observed_ts - after).total_seconds()
+            delay_hi = (observed_ts - before).total_seconds()
+            self._samples.append(((delay_lo + delay_hi) / 2, (delay_hi - delay_lo) / 2))
+        return True
+
+    def _delay(self) -> Optional[LadderDelay]:
+        if len(self._samples) < MIN_DELAY_SAMPLES:
+            return None
+        samples = np.array(self._samples)
+        mid = np.median(samples[:, 0])
+        # a bracket of half width h has a standard deviation of h / sqrt(3), plus the spread between samples
+        spread = 1.4826 * np.median(np.abs(samples[:, 0] - mid))
+        uncertainty = np.sqrt(np.median(samples[:, 1]) ** 2 / 3 + spread ** 2)
+        return LadderDelay(timedelta(seconds=max(0.0, mid)), timedelta(seconds=float(uncertainty)), len(samples))
+
+    def _fit(self, ts: datetime, xp: int, tolerance: timedelta) -> Optional[datetime]:
+        """
+        :return: ts moved by up to tolerance to lie after the ocr readings with less xp and before those with more, None if
+        impossible. only ocr readings within MAX_LADDER_DELAY are considered, older ones may precede a death
+        """
+        lo = bisect.bisect_left(self._ocr_ts, ts - MAX_LADDER_DELAY)
+        hi = bisect.bisect(self._ocr_ts, ts + MAX_LADDER_DELAY)
+        less = [i for i in range(lo, hi) if self._ocr_xp[i] < xp]
+        more = [i for i in range(lo, hi) if self._ocr_xp[i] > xp]
+        if less and more and less[-1] > more[0]:
+            return None
+        earliest = ts - tolerance
+        latest = ts + tolerance
+        if less:
+            earliest = max(earliest, self._ocr_ts[less[-1]])
+        if more:
+            latest = min(latest, self._ocr_ts[more[0]])
+        if earliest > latest:
+            return None
+        return min(max(ts, earliest), latest)
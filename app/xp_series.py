@@ -0,0 +1,187 @@
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import numpy as np
+from db import conn
+from poe_bridge import events
+
+# bucket name -> interval, sessions are split at gaps of more than SESSION_GAP between maps
+BUCKETS = {
+    "5m": timedelta(minutes=5),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+    "session": None
+}
+SESSION_GAP = timedelta(minutes=30)
+METRICS = ("xph", "maps_per_hour", "idle_fraction", "encounter_rate")
+
+_MAPS_QUERY = """
+    WITH m AS (
+        SELECT
+            id,
+            CAST(data->'span'->>'start' AS TIMESTAMP) AS start_ts,
+            CAST(data->'span'->>'end' AS TIMESTAMP) AS end_ts,
+            CAST(data->>'xp_gained' AS BIGINT) AS xp_gained,
+            CAST(data->'span'->>'map_time' AS DOUBLE) AS map_time,
+            CAST(data->'span'->>'load_time' AS DOUBLE) + CAST(data->'span'->>'pause_time' AS DOUBLE) + CAST(data->'span'->>'hideout_time' AS DOUBLE) AS idle_time
+        FROM maps
+    ), e AS (
+        SELECT map_id, count(*) AS encounters FROM encounters WHERE map_id IS NOT NULL GROUP BY map_id
+    )
+    SELECT m.*, COALESCE(e.encounters, 0) AS encounters
+    FROM m LEFT JOIN e ON e.map_id = m.id
+    WHERE m.end_ts IS NOT NULL AND m.end_ts >= $since
+"""
+
+_INTERVAL_QUERY = f"""
+    SELECT
+        time_bucket(to_seconds($interval), end_ts) AS bucket_start,
+        time_bucket(to_seconds($interval), end_ts) + to_seconds($interval) AS bucket_end,
+        count(*), sum(xp_gained), sum(map_time), sum(idle_time), sum(encounters)
+    FROM ({_MAPS_QUERY})
+    GROUP BY bucket_start
+    ORDER BY bucket_start
+"""
+
+_SESSION_QUERY = f"""
+    SELECT min(start_ts), max(end_ts), count(*), sum(xp_gained), sum(map_time), sum(idle_time), sum(encounters)
+    FROM (
+        SELECT *, sum(CASE WHEN prev_end_ts IS NULL OR start_ts - prev_end_ts > to_seconds($gap) THEN 1 ELSE 0 END) OVER (ORDER BY start_ts) AS session
+        FROM (
+            SELECT *, lag(end_ts) OVER (ORDER BY start_ts) AS prev_end_ts FROM ({_MAPS_QUERY})
+        )
+    )
+    GROUP BY session
+    ORDER BY session
+"""
+
+@dataclass
+class SeriesPoint:
+    start: datetime
+    end: datetime
+    maps: int
+    xp: int
+    map_seconds: float
+    idle_seconds: float
+    encounters: int
+
+    def active_hours(self):
+        return (self.map_seconds + self.idle_seconds) / 3600
+
+    def xph(self):
+        return self.xp / self.active_hours() if self.active_hours() > 0 else 0.0
+
+    def maps_per_hour(self):
+        return self.maps / self.active_hours() if self.active_hours() > 0 else 0.0
+
+    def idle_fraction(self):
+        total = self.map_seconds + self.idle_seconds
+        return self.idle_seconds / total if total > 0 else 0.0
+
+    def encounter_rate(self):
+        """
+        encounters per hour
+        """
+        return self.encounters / self.active_hours() if self.active_hours() > 0 else 0.0
+
+    @classmethod
+    def from_row(cls, row):
+        start, end, maps, xp, map_seconds, idle_seconds, encounters = row
+        return cls(start, end, int(maps), int(xp or 0), float(map_seconds or 0), float(idle_seconds or 0), int(encounters or 0))
+
+class XPSeriesEngine:
+    """
+    Bucketed xp/h, maps/h, idle fraction and encounter rate (per hour) of completed maps, bucketed by map end
+    (or by session). closed buckets are cached, only the most recent bucket is recomputed on read
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache: dict[str, list[SeriesPoint]] = {}
+
+    def invalidate(self, since: datetime = None):
+        """
+        drops cached buckets that maps starting at since could belong to (or be bridged into, for sessions), all if None
+        """
+        with self._lock:
+            if since is None:
+                self._cache.clear()
+                return
+            for bucket, points in self._cache.items():
+                cutoff = since - SESSION_GAP if BUCKETS[bucket] is None else since
+                self._cache[bucket] = [p for p in points if p.end < cutoff]
+
+    def series(self, bucket: str = "hour") -> list[SeriesPoint]:
+        if bucket not in BUCKETS:
+            raise ValueError(f"Unknown bucket: {bucket}, must be one of {list(BUCKETS)}")
+        with self._lock:
+            cached = self._cache.get(bucket, [])
+            # the most recent bucket may still be open, recompute it along with anything newer
+            closed = cached[:-1]
+            since = cached[-1].start if cached else datetime.min
+            self._cache[bucket] = points = closed + self._query(bucket, since)
+            return list(points)
+
+    def plot_data(self, metric: str, bucket: str = "hour", max_points: int = 1000) -> tuple[np.ndarray, np.ndarray]:
+        """
+        :return: bucket starts (epoch seconds) and metric values, downsampled to at most max_points
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric: {metric}, must be one of {list(METRICS)}")
+        points = self.series(bucket)
+        x = np.array([(p.start - datetime(1970, 1, 1)).total_seconds() for p in points], dtype=np.float64)
+        y = np.array([getattr(p, metric)() for p in points], dtype=np.float64)
+        return lttb(x, y, max_points)
+
+    def _query(self, bucket: str, since: datetime) -> list[SeriesPoint]:
+        cursor = conn.cursor()
+        try:
+            if BUCKETS[bucket] is None:
+                rows = cursor.execute(_SESSION_QUERY, {"since": since, "gap": int(SESSION_GAP.total_seconds())}).fetchall()
+            else:
+                rows = cursor.execute(_INTERVAL_QUERY, {"since": since, "interval": int(BUCKETS[bucket].total_seconds())}).fetchall()
+        finally:
+            cursor.close()
+        return [SeriesPoint.from_row(row) for row in rows]
+
+def lttb(x, y, max_points: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Largest-Triangle-Three-Buckets downsampling, keeps the first and last point and from each of the max_points - 2
+    buckets in between the point forming the largest triangle with the previously kept point and the next bucket's average.
+
+    :param x: Array of strictly increasing x values.
+    :param y: Array of y values.
+    :return: Downsampled (x, y), unchanged if there are at most max_points points.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return x, y
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    ix = np.empty(max_points, dtype=np.int64)
+    ix[0] = a = 0
+    ix[-1] = n - 1
+    for i in range(max_points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[hi:next_hi].mean()
+        avg_y = y[hi:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        ix[i + 1] = a
+    return x[ix], y[ix]
+
+xp_series = XPSeriesEngine()
+
+# maps can end in buckets that are already closed, e.g. when completed out of order
+events.on("map_completed", lambda event: xp_series.invalidate(event["map"].span.start))
+events.on("map_deleted", lambda event: xp_series.invalidate(event["map"].span.start))
+events.on("maps_imported", lambda _: xp_series.invalidate())
+
+if __name__ == "__main__":
+    for bucket in BUCKETS:
+        points = xp_series.series(bucket)
+        print(f"{bucket}: {len(points)} buckets")
+        for p in points[-3:]:
+            print(f"  {p.start} - {p.end}: {p.maps} maps, {p.xph():.0f} xp/h, {p.maps_per_hour():.1f} maps/h, {p.idle_fraction():.0%} idle, {p.encounter_rate():.1f} encounters/h")
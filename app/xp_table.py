@@ -1,4 +1,4 @@
-import bisect
+import numpy as np
 
 # Experience table mapping levels to total XP required (lower bounds)
 experience_table = [
@@ -17,6 +17,70 @@ experience_table = [
 # Total levels available
 max_level = len(experience_table)
 
+experience_table_np = np.array(experience_table, dtype=np.int64)
+# XP lower and upper bound per level (index = level - 1), the max level has an empty range
+level_lower_bounds = experience_table_np
+level_upper_bounds = np.append(experience_table_np[1:], experience_table_np[-1])
+
+def get_levels_from_xp(xp):
+    """
+    Array version of get_level_from_xp.
+
+    :param xp: Array of experience values.
+    :return: Array of levels, 0 for invalid (negative) experience values.
+    """
+    return np.searchsorted(experience_table_np, np.asarray(xp, dtype=np.int64), side="right")
+
+def get_xp_ranges_for_levels(levels):
+    """
+    Array version of get_xp_range_for_level.
+
+    :param levels: Array of levels.
+    :return: A tuple of arrays (lower_bounds, upper_bounds).
+    """
+    levels = np.asarray(levels, dtype=np.int64)
+    if np.any((levels < 1) | (levels > max_level)):
+        raise ValueError(f"Levels out of bounds, must be between 1 and {max_level}")
+    return level_lower_bounds[levels - 1], level_upper_bounds[levels - 1]
+
+def get_level_progress(xp):
+    """
+    Fraction of the current level's XP range reached, 1.0 at max level.
+
+    :param xp: Array of non-negative experience values.
+    :return: Array of fractions in [0, 1).
+    """
+    xp = np.asarray(xp, dtype=np.int64)
+    lo, hi = get_xp_ranges_for_levels(get_levels_from_xp(xp))
+    width = hi - lo
+    return np.divide(xp - lo, width, out=np.ones(xp.shape, dtype=np.float64), where=width > 0)
+
+def split_xp_ranges(xp_start, xp_end):
+    """
+    Array version of split_xp_range, splits XP ranges at level boundaries.
+
+    :param xp_start: Array of range starts.
+    :param xp_end: Array of range ends.
+    :return: Matrix of shape (len(xp_start), max_level) holding the XP gained within each level (index = level - 1).
+    """
+    xp_start = np.asarray(xp_start, dtype=np.int64)
+    xp_end = np.asarray(xp_end, dtype=np.int64)
+    if np.any(xp_start < 0) or np.any(xp_end < 0):
+        raise ValueError("xp_start and xp_end must be non-negative")
+    lo = np.maximum(xp_start[..., None], level_lower_bounds)
+    hi = np.minimum(xp_end[..., None], level_upper_bounds)
+    return np.clip(hi - lo, 0, None)
+
+def _signed_xp_amounts(xp_start, xp_end):
+    """
+    split_xp_ranges, with xp lost within a level (e.g. on death) as a negative amount. xp is never lost across a level
+    boundary, such reversed ranges have no amounts
+    """
+    xp_start = np.asarray(xp_start, dtype=np.int64)
+    xp_end = np.asarray(xp_end, dtype=np.int64)
+    lost = (xp_end < xp_start) & (get_levels_from_xp(xp_start) == get_levels_from_xp(xp_end))
+    return np.where(lost[..., None], -split_xp_ranges(xp_end, xp_start), split_xp_ranges(xp_start, xp_end))
+
 def get_level_from_xp(xp):
     """
     Get the character level for a given experience value using binary search.
@@ -24,8 +88,8 @@ def get_level_from_xp(xp):
     :param xp: The experience value to search for.
     :return: The level corresponding to the given experience.
     """
-    index = bisect.bisect_right(experience_table, xp) - 1
-    return index + 1 if 0 <= index < max_level else None
+    level = int(get_levels_from_xp(xp))
+    return level if level > 0 else None
 
 def get_xp_range_for_level(level):
     """
@@ -36,48 +100,101 @@ def get_xp_range_for_level(level):
     """
     if level < 1 or level > max_level:
         raise ValueError(f"Level {level} is out of bounds, must be between 1 and {max_level}")
-    lo = experience_table[level - 1]
-    if 1 <= level < max_level:
-        return lo, experience_table[level]
-    elif level == max_level:
-        return lo, lo
+    lo, hi = get_xp_ranges_for_levels(level)
+    return int(lo), int(hi)
 
 def split_xp_range(range):
     xp_start, xp_end = range
-    if xp_start < 0 or xp_end < 0:
-        raise ValueError("xp_start and xp_end must be non-negative")
-        
-    ix = bisect.bisect_right(experience_table, xp_start)
-    lo = xp_start
+    amounts = split_xp_ranges(xp_start, xp_end)
+    if xp_end < xp_start:
+        # reversed ranges (e.g. deaths) are returned whole, below the max level
+        return [(xp_start, xp_end)] if xp_start < experience_table[-1] else []
     ranges = []
-    while ix < len(experience_table):
-        next = experience_table[ix]
-        ix += 1
-        if next > xp_end:
-            next = xp_end
-        if lo == next:
-            break
-        ranges.append((lo, next))
-        lo = next
-        
+    for ix in np.flatnonzero(amounts):
+        lo = max(xp_start, experience_table[ix])
+        ranges.append((lo, lo + int(amounts[ix])))
     return ranges
 
 def unapply_xp_penalty(penalized_xp_range, area_level):
     xp_lo, xp_hi = penalized_xp_range
-    lvl_lo, lvl_hi = get_level_from_xp(xp_lo), get_level_from_xp(xp_hi)
-    lvl_ranges = range(lvl_lo, lvl_hi + 1)
-    xp_ranges = split_xp_range((xp_lo, xp_hi))
+    amounts = _signed_xp_amounts(xp_lo, xp_hi)
+    multipliers = _penalty_model.multipliers(np.arange(1, max_level + 1), area_level)
+    unpenalized_xp_values = (amounts / multipliers).astype(np.int64)
+    return [int(xp) for xp in unpenalized_xp_values[amounts != 0]]
 
-    unpenalized_xp_values = []
-    for xp_range, lvl in zip(xp_ranges, lvl_ranges):
-        delta = xp_range[1] - xp_range[0]
-        penalty_multiplier = _penalty_formula_maybe_poe2(lvl, area_level)
-        unpenalized_xp_values.append(int(delta / penalty_multiplier))
+def unapply_xp_penalties(xp_start, xp_end, area_level, model=None):
+    """
+    Array version of unapply_xp_penalty.
 
-    return unpenalized_xp_values
+    :param xp_start: Array of penalized range starts.
+    :param xp_end: Array of penalized range ends.
+    :param area_level: Array of area levels the XP was gained in.
+    :param model: PenaltyModel or name of a registered one, defaults to the active model.
+    :return: Array of total unpenalized XP per range, negative for XP lost within a level.
+    """
+    model = _resolve_penalty_model(model)
+    amounts = _signed_xp_amounts(xp_start, xp_end)
+    multipliers = model.multipliers(np.arange(1, max_level + 1), np.asarray(area_level)[..., None])
+    return (amounts / multipliers).astype(np.int64).sum(axis=-1)
 
 def get_xp_penalty_multiplier(character_level, area_level):
-    return _penalty_formula_maybe_poe2(character_level, area_level)
+    return float(_penalty_model.multipliers(character_level, area_level))
+
+def get_xp_penalty_multipliers(character_levels, area_levels, model=None):
+    """
+    Array version of get_xp_penalty_multiplier.
+    """
+    return _resolve_penalty_model(model).multipliers(character_levels, area_levels)
+
+MAX_AREA_LEVEL = 100
+
+class PenaltyModel:
+    """
+    Penalty formula with its multipliers precomputed for every (character level, area level) pair
+    """
+
+    def __init__(self, formula, max_area_level=MAX_AREA_LEVEL):
+        self.formula = formula
+        self.max_area_level = max_area_level
+        # index = [character_level - 1, area_level]
+        self.table = np.array([
+            [formula(character_level, area_level) for area_level in range(max_area_level + 1)]
+            for character_level in range(1, max_level + 1)
+        ], dtype=np.float64)
+
+    def multipliers(self, character_levels, area_levels):
+        character_levels = np.asarray(character_levels, dtype=np.int64)
+        area_levels = np.asarray(area_levels, dtype=np.int64)
+        if np.any((character_levels < 1) | (character_levels > max_level)):
+            raise ValueError(f"Levels out of bounds, must be between 1 and {max_level}")
+        if np.any((area_levels < 0) | (area_levels > self.max_area_level)):
+            raise ValueError(f"Area levels out of bounds, must be between 0 and {self.max_area_level}")
+        return self.table[character_levels - 1, area_levels]
+
+def register_penalty_model(name, formula, max_area_level=MAX_AREA_LEVEL):
+    penalty_models[name] = model = PenaltyModel(formula, max_area_level)
+    return model
+
+def set_penalty_model(model):
+    """
+    Sets the model used by the penalty functions, either a PenaltyModel or the name of a registered one.
+    """
+    global _penalty_model
+    _penalty_model = _resolve_penalty_model(model)
+
+def get_penalty_model():
+    return _penalty_model
+
+def _resolve_penalty_model(model):
+    if model is None:
+        return _penalty_model
+    if isinstance(model, str):
+        if model not in penalty_models:
+            raise ValueError(f"Unknown penalty model: {model}")
+        return penalty_models[model]
+    if not isinstance(model, PenaltyModel):
+        raise TypeError("model must be a PenaltyModel or the name of a registered one")
+    return model
 
 def _penalty_formula_poe1(character_level, area_level):
     safe_zone = 3 + character_level // 16
@@ -94,6 +211,11 @@ def _penalty_formula_maybe_poe2(character_level, area_level):
     # very rough guess, probably incorrect
     return (character_level + 5) / (character_level + 5 + level_difference**3) ** 1.5
 
+penalty_models = {}
+register_penalty_model("poe1", _penalty_formula_poe1)
+register_penalty_model("poe2", _penalty_formula_maybe_poe2)
+_penalty_model = penalty_models["poe2"]
+
 # Example Usage
 if __name__ == "__main__":
     # Example XP queries
@@ -108,11 +230,11 @@ if __name__ == "__main__":
 
     (a, b) = get_xp_range_for_level(90)
     print(f"xp_range: {xp_range}")
-    split_xp_ranges = split_xp_range((a - 10000, b + 200))
+    splits = split_xp_range((a - 10000, b + 200))
     y = b - a
-    k = sum(next - lo for lo, next in split_xp_ranges)
+    k = sum(next - lo for lo, next in splits)
     print(f"y: {y}, k: {k}")
-    print(f"splits: {split_xp_ranges}")
+    print(f"splits: {splits}")
 
     # Example usage
     penalized_xp = 3_000_000_000  # 3B
@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+from instance_tracker import MapInstance, XPSnapshot
+from xp_table import get_level_from_xp, get_xp_range_for_level, max_level
+
+# fraction of the current level's xp range lost on death
+DEATH_XP_LOSS = 0.1
+# readings implying more than XPH_TOLERANCE times the best recent xph are rejected
+XPH_TOLERANCE = 3.0
+# xp gained in short intervals is compared against at least this much time, encounters can pay out in bursts
+MIN_RATE_INTERVAL = timedelta(minutes=5)
+AREA_LEVEL_TOLERANCE = 2
+# readings that break continuity with the previous snapshot (e.g. after switching characters) are accepted once this
+# many ocr passes of a capture agree on them
+MIN_AGREEING_PASSES = 2
+
+def max_plausible_xph(maps: Iterable[MapInstance], area_level: Optional[int] = None) -> Optional[float]:
+    """
+    Best xph of the given maps within AREA_LEVEL_TOLERANCE of area_level (or of all maps if none are close) times XPH_TOLERANCE.
+    """
+    xphs = [(m.xph, m.area_level) for m in maps if m.xph and m.xph > 0]
+    if area_level is not None:
+        close = [xph for xph, al in xphs if abs(al - area_level) <= AREA_LEVEL_TOLERANCE]
+        if close:
+            return max(close) * XPH_TOLERANCE
+    return max(xph for xph, _ in xphs) * XPH_TOLERANCE if xphs else None
+
+def previous_snapshot(snapshots: Iterable[XPSnapshot], ts: Optional[datetime] = None) -> Optional[XPSnapshot]:
+    """
+    :return: the latest snapshot taken at or before ts, deferred readings are checked against what preceded them
+    """
+    return next((snapshot for snapshot in reversed(list(snapshots)) if ts is None or snapshot.ts <= ts), None)
+
+class XPReadingValidator:
+    """
+    Checks OCR xp readings against constraints every true reading satisfies:
+    - next level xp is the upper bound of the level the xp is in
+    - xp does not decrease, except by up to one death's xp loss within the same level
+    - xp gained since the previous snapshot does not exceed max_xph (if known)
+
+    the last two only hold while playing the same character. a reading breaking just those is accepted once
+    MIN_AGREEING_PASSES ocr passes agree on it, or if it is continuous with the unconfirmed reading of the previous capture
+    """
+
+    def __init__(self, previous: Optional[XPSnapshot] = None, ts: Optional[datetime] = None, max_xph: Optional[float] = None,
+                 unconfirmed: Optional[XPSnapshot] = None):
+        self.previous = previous
+        self.ts = ts or datetime.now()
+        self.max_xph = max_xph
+        self.unconfirmed = unconfirmed
+        self._discontinuous = []
+
+    def check(self, xp: int, next_level_xp: Optional[int]) -> Optional[str]:
+        """
+        :return: the violated constraint, None if the reading is valid
+        """
+        violation = self.check_reading(xp, next_level_xp)
+        if violation:
+            return violation
+        violation = self.check_continuity(xp, self.previous)
+        if violation is None:
+            return None
+        self._discontinuous.append(xp)
+        if self._discontinuous.count(xp) >= MIN_AGREEING_PASSES:
+            print(f"[Info] accepting discontinuous XP reading {xp}, {MIN_AGREEING_PASSES} OCR passes agree")
+            return None
+        if self.unconfirmed and self.check_continuity(xp, self.unconfirmed) is None:
+            print(f"[Info] accepting discontinuous XP reading {xp}, it continues the previous capture")
+            return None
+        return violation
+
+    def next_unconfirmed(self) -> Optional[XPSnapshot]:
+        """
+        :return: the most common reading rejected only for breaking continuity, to pass to the next capture's validator
+        """
+        if not self._discontinuous:
+            return None
+        xp = max(self._discontinuous, key=self._discontinuous.count)
+        return XPSnapshot("unconfirmed", self.ts, xp, 0)
+
+    def check_reading(self, xp: int, next_level_xp: Optional[int]) -> Optional[str]:
+        level = get_level_from_xp(xp)
+        if level is None:
+            return "negative xp"
+        xp_lo, xp_hi = get_xp_range_for_level(level)
+        if level < max_level and next_level_xp != xp_hi:
+            return f"next level xp {next_level_xp} is not the level {level} boundary {xp_hi}"
+        return None
+
+    def check_continuity(self, xp: int, previous: Optional[XPSnapshot]) -> Optional[str]:
+        if previous is None:
+            return None
+        if xp < previous.xp:
+            prev_lo, prev_hi = get_xp_range_for_level(get_level_from_xp(previous.xp))
+            if xp < prev_lo or previous.xp - xp > DEATH_XP_LOSS * (prev_hi - prev_lo):
+                return f"xp decreased by {previous.xp - xp}, more than a death's loss"
+        elif self.max_xph and self.ts > previous.ts:
+            hours = max(self.ts - previous.ts, MIN_RATE_INTERVAL).total_seconds() / 3600
+            if (xp - previous.xp) / hours > self.max_xph:
+                return f"implied xph {(xp - previous.xp) / hours:.0f} exceeds {self.max_xph:.0f}"
+        return None
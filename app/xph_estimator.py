@@ -0,0 +1,133 @@
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Optional
+from sortedcontainers import SortedList
+from instance_tracker import MapInstance
+
+class TrimmedXPHEstimator:
+    """
+    Trimmed mean of map xph, weighted by map time. maps are partitioned into the trimmed low and high tails
+    and the kept middle, whose weighted sums are maintained incrementally: O(log n) per update, O(1) per read.
+
+    the window is bounded by max_maps (most recently added maps), max_age (relative to the most recently
+    completed map) and/or since (maps completed before are ignored), unbounded if none are given
+    """
+
+    def __init__(self, trim: float = 0.1, max_maps: Optional[int] = None, max_age: Optional[timedelta] = None, since: Optional[datetime] = None):
+        if not 0 <= trim < 0.5:
+            raise ValueError("trim must be in [0, 0.5)")
+        self.trim = trim
+        self.max_maps = max_maps
+        self.max_age = max_age
+        self.since = since
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self._lo = SortedList()
+        self._mid = SortedList()
+        self._hi = SortedList()
+        # map id -> (xph, map id, map seconds, end)
+        self._entries = {}
+        self._order = deque()
+        self._weight = 0.0
+        self._weighted_sum = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def value(self) -> float:
+        return self._weighted_sum / self._weight if self._weight > 0 else 0.0
+
+    def reset(self, maps):
+        with self._lock:
+            self.clear()
+            for m in maps:
+                self._add(m)
+
+    def add(self, map: MapInstance):
+        with self._lock:
+            self._add(map)
+
+    def remove(self, map_id: str):
+        with self._lock:
+            self._remove(map_id)
+
+    def _add(self, map: MapInstance):
+        if not map.xph or map.id in self._entries or not map.span.end:
+            return
+        if self.since and map.span.end < self.since:
+            return
+        seconds = float(map.span.map_time().total_seconds())
+        if seconds <= 0:
+            return
+        key = (float(map.xph), map.id, seconds, map.span.end)
+        self._entries[map.id] = key
+        self._order.append(map.id)
+        if self._lo and key < self._lo[-1]:
+            self._lo.add(key)
+        elif self._hi and key > self._hi[0]:
+            self._hi.add(key)
+        else:
+            self._add_mid(key)
+        self._evict(map.span.end)
+        self._rebalance()
+
+    def _remove(self, map_id: str):
+        key = self._entries.pop(map_id, None)
+        if key is None:
+            return
+        if key in self._lo:
+            self._lo.remove(key)
+        elif key in self._hi:
+            self._hi.remove(key)
+        else:
+            self._remove_mid(key)
+        self._rebalance()
+
+    def _evict(self, latest_end: datetime):
+        while self._order:
+            map_id = self._order[0]
+            key = self._entries.get(map_id)
+            if key is None:
+                # already removed
+                self._order.popleft()
+            elif (self.max_maps and len(self._entries) > self.max_maps) or (self.max_age and key[3] < latest_end - self.max_age):
+                self._order.popleft()
+                self._remove(map_id)
+            else:
+                break
+
+    def _rebalance(self):
+        k = int(len(self._entries) * self.trim + 1e-9)
+        while len(self._lo) > k:
+            self._add_mid(self._lo.pop(-1))
+        while len(self._hi) > k:
+            self._add_mid(self._hi.pop(0))
+        while len(self._lo) < k and self._mid:
+            self._lo.add(self._pop_mid(0))
+        while len(self._hi) < k and self._mid:
+            self._hi.add(self._pop_mid(-1))
+
+    def _add_mid(self, key):
+        self._mid.add(key)
+        self._weight += key[2]
+        self._weighted_sum += key[0] * key[2]
+
+    def _remove_mid(self, key):
+        self._mid.remove(key)
+        self._subtract(key)
+
+    def _pop_mid(self, index):
+        key = self._mid.pop(index)
+        self._subtract(key)
+        return key
+
+    def _subtract(self, key):
+        if not self._mid:
+            # avoid accumulating float drift
+            self._weight = self._weighted_sum = 0.0
+        else:
+            self._weight -= key[2]
+            self._weighted_sum -= key[0] * key[2]